@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# Benchmark do envio pelo ZyboSerialDriver sem a placa: o dispositivo UIO é
+# substituído por um arquivo comum de 4 KiB, mapeado em memória da mesma forma.
+# Como um arquivo comum não pode ser monitorado com epoll, o laço de eventos
+# usa o seletor baseado em select().
+import asyncio
+import os
+import selectors
+import struct
+import tempfile
+import timeit
+
+from camadafisica import ZyboSerialDriver
+
+PORTA = 4
+QUADROS = 200
+
+
+def criar_dispositivo_falso():
+    arquivo = tempfile.NamedTemporaryFile(delete=False)
+    # Registrador 0 (fila de recepção) vazio: -1
+    arquivo.write(b'\xff' * 0x1000)
+    arquivo.close()
+    return arquivo.name
+
+
+def enviar_antigo(mm, port, data):
+    for b in data:
+        mm[port*4:port*4+4] = struct.pack('I', b)
+
+
+async def medir(driver, tamanho):
+    quadros = [os.urandom(tamanho) for _ in range(QUADROS)]
+    fila = driver.filas_tx[PORTA]
+
+    inicio = timeit.default_timer()
+    for quadro in quadros:
+        enviar_antigo(driver.mm, PORTA, quadro)
+    antigo = timeit.default_timer() - inicio
+
+    inicio = timeit.default_timer()
+    for quadro in quadros:
+        driver.enviar(PORTA, quadro)
+    while fila:
+        await asyncio.sleep(0)
+    novo = timeit.default_timer() - inicio
+
+    assert driver.regs[PORTA] == quadros[-1][-1]
+    return antigo, novo
+
+
+def main():
+    caminho = criar_dispositivo_falso()
+    loop = asyncio.SelectorEventLoop(selectors.SelectSelector())
+    asyncio.set_event_loop(loop)
+    try:
+        driver = ZyboSerialDriver(caminho)
+        # O primeiro "unmask" do driver é escrito no início do arquivo,
+        # então esvazia a fila de recepção falsa novamente
+        driver.regs[0] = 0xffffffff
+        print('%8s %16s %16s %8s' % ('tamanho', 'antigo (MB/s)', 'novo (MB/s)', 'ganho'))
+        for tamanho in (64, 576, 1500, 8192):
+            antigo, novo = loop.run_until_complete(medir(driver, tamanho))
+            total = tamanho * QUADROS / 1e6
+            print('%8d %16.2f %16.2f %7.1fx' % (tamanho, total/antigo, total/novo,
+                                                antigo/novo))
+    finally:
+        loop.close()
+        os.unlink(caminho)
+
+
+if __name__ == '__main__':
+    main()
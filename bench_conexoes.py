@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Mede a memória ocupada por conexões ociosas, como as de um servidor IRC
+# com muitos clientes parados, e verifica que as conexões abandonadas pelo
+# outro lado são recolhidas pelo limite de ociosidade do Servidor.
+import asyncio
+import tracemalloc
+
+from bench_congestionamento import LacoVirtual
+from tcp import Servidor, montar_cabecalho
+from tcputils import *
+
+CONEXOES = 10000
+PORTA_SERVIDOR = 7000
+SERVIDOR = '10.0.0.1'
+OCIOSIDADE_MAXIMA = 600
+
+
+class Rede:
+    ignore_checksum = True
+
+    def registrar_recebedor(self, callback):
+        self.callback = callback
+
+    def enviar(self, segmento, dest_addr):
+        self.ultimo = segmento
+
+
+def origem(i):
+    return '10.%d.%d.%d' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff)
+
+
+def main():
+    loop = LacoVirtual()
+    asyncio.set_event_loop(loop)
+    rede = Rede()
+    servidor = Servidor(rede, PORTA_SERVIDOR, backlog=CONEXOES,
+                        ociosidade_maxima=OCIOSIDADE_MAXIMA)
+    servidor.registrar_monitor_de_conexoes_aceitas(
+        lambda conexao: conexao.registrar_recebedor(lambda conexao, dados: None))
+
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    for i in range(CONEXOES):
+        src_addr = origem(i)
+        rede.callback(src_addr, SERVIDOR, montar_cabecalho(40000, PORTA_SERVIDOR, 1000, 0,
+                                                           FLAGS_SYN))
+        iss = read_header(rede.ultimo)[2]
+        rede.callback(src_addr, SERVIDOR, montar_cabecalho(40000, PORTA_SERVIDOR, 1001,
+                                                           iss + 1, FLAGS_ACK))
+    memoria = tracemalloc.get_traced_memory()[0] - antes
+    tracemalloc.stop()
+    print('%d conexões ociosas: %.0f bytes por conexão, %d temporizadores armados' %
+          (CONEXOES, memoria / CONEXOES, len(servidor.temporizadores)))
+
+    # Os clientes somem sem fechar as conexões
+    loop.run_until_complete(asyncio.sleep(OCIOSIDADE_MAXIMA + 1))
+    print('depois de %d s sem atividade: %d conexões, %d temporizadores armados' %
+          (OCIOSIDADE_MAXIMA, len(servidor.conexoes), len(servidor.temporizadores)))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# Compara o goodput dos algoritmos de congestionamento.py em um enlace
+# emulado com banda, atraso, fila e perda configuráveis. O laço de eventos
+# usa um relógio virtual que avança direto para o próximo timer, então a
+# transferência não leva o tempo real que levaria no enlace.
+import argparse
+import asyncio
+import random
+import selectors
+
+from congestionamento import Reno, NewReno, Cubic
+from tcp import Servidor, montar_cabecalho, opcao_sack, opcao_escala_janela, \
+    OPCOES_SACK_PERMITIDO, MAX_BLOCOS_SACK
+from tcputils import *
+
+CLIENTE = '10.0.0.2'
+SERVIDOR = '10.0.0.1'
+PORTA_CLIENTE = 40000
+PORTA_SERVIDOR = 7000
+# Janela anunciada pelo cliente, grande o bastante para não limitar o envio
+ESCALA_CLIENTE = 8
+JANELA_CLIENTE = 0xffff << ESCALA_CLIENTE
+
+
+class SeletorVirtual(selectors.SelectSelector):
+    def __init__(self):
+        super().__init__()
+        self.agora = 0.0
+
+    def select(self, timeout=None):
+        # Não há descritores de verdade: só avança o relógio até o próximo timer
+        if timeout:
+            self.agora += timeout
+        return []
+
+
+class LacoVirtual(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self._seletor_virtual = SeletorVirtual()
+        super().__init__(self._seletor_virtual)
+
+    def time(self):
+        return self._seletor_virtual.agora
+
+
+class Enlace:
+    """
+    Enlace em um só sentido, com taxa de transmissão (bytes/s), atraso de
+    propagação (s), fila limitada (bytes) e perda aleatória
+    """
+    def __init__(self, loop, taxa, atraso, fila, perda, entregar):
+        self.loop = loop
+        self.taxa = taxa
+        self.atraso = atraso
+        self.fila = fila
+        self.perda = perda
+        self.entregar = entregar
+        self.livre_em = 0.0
+        self.descartados = 0
+
+    def transmitir(self, dados):
+        agora = self.loop.time()
+        inicio = max(agora, self.livre_em)
+        if (inicio - agora) * self.taxa > self.fila:
+            self.descartados += 1
+            return
+        self.livre_em = inicio + len(dados) / self.taxa
+        if random.random() < self.perda:
+            self.descartados += 1
+            return
+        self.loop.call_at(self.livre_em + self.atraso, self.entregar, dados)
+
+
+class Cliente:
+    """
+    Ponta receptora: abre a conexão, guarda segmentos fora de ordem e
+    reconhece cumulativamente cada segmento recebido, informando com blocos
+    SACK o que guardou se sack for True
+    """
+    def __init__(self, loop, total, sack):
+        self.loop = loop
+        self.total = total
+        self.sack = sack
+        self.ultimo = None
+        self.proximo = None
+        self.fora_de_ordem = {}
+        self.recebidos = 0
+        self.terminou_em = None
+
+    def conectar(self):
+        opcoes = opcao_escala_janela(ESCALA_CLIENTE)
+        if self.sack:
+            opcoes += OPCOES_SACK_PERMITIDO
+        self.enviar(1000, 0, FLAGS_SYN, opcoes, 0xffff)
+
+    def enviar(self, seq_no, ack_no, flags, opcoes=b'',
+               janela=JANELA_CLIENTE >> ESCALA_CLIENTE):
+        segmento = fix_checksum(montar_cabecalho(PORTA_CLIENTE, PORTA_SERVIDOR,
+                                                 seq_no, ack_no, flags, opcoes,
+                                                 janela),
+                                CLIENTE, SERVIDOR)
+        self.volta.transmitir(segmento)
+
+    def blocos_sack(self):
+        blocos = []
+        for inicio in sorted(self.fora_de_ordem):
+            fim = inicio + len(self.fora_de_ordem[inicio])
+            if blocos and blocos[-1][1] == inicio:
+                blocos[-1][1] = fim
+            else:
+                blocos.append([inicio, fim])
+        blocos.sort(key=lambda bloco: not bloco[0] <= self.ultimo < bloco[1])
+        return blocos[:MAX_BLOCOS_SACK]
+
+    def receber(self, segmento):
+        _, _, seq_no, _, flags, _, _, _ = read_header(segmento)
+        payload = bytes(segmento[4*(flags>>12):])
+        if flags & FLAGS_SYN:
+            self.proximo = seq_no + 1
+        elif seq_no == self.proximo:
+            self.proximo += len(payload)
+            self.recebidos += len(payload)
+            while self.proximo in self.fora_de_ordem:
+                payload = self.fora_de_ordem.pop(self.proximo)
+                self.proximo += len(payload)
+                self.recebidos += len(payload)
+        elif seq_no > self.proximo:
+            self.fora_de_ordem[seq_no] = payload
+            self.ultimo = seq_no
+        opcoes = b''
+        if self.sack and self.fora_de_ordem:
+            opcoes = opcao_sack(self.blocos_sack())
+        self.enviar(1001, self.proximo, FLAGS_ACK, opcoes)
+        if self.recebidos >= self.total and self.terminou_em is None:
+            self.terminou_em = self.loop.time()
+
+
+class Rede:
+    ignore_checksum = True
+
+    def registrar_recebedor(self, callback):
+        self.callback = callback
+
+    def enviar(self, segmento, dest_addr):
+        self.ida.transmitir(bytes(segmento))
+
+
+def medir(controle, sack, args):
+    random.seed(args.semente)
+    loop = LacoVirtual()
+    asyncio.set_event_loop(loop)
+
+    rede = Rede()
+    cliente = Cliente(loop, args.bytes, sack)
+    rede.ida = Enlace(loop, args.taxa / 8, args.atraso / 2, args.fila,
+                      args.perda, cliente.receber)
+    cliente.volta = Enlace(loop, args.taxa / 8, args.atraso / 2, args.fila, 0,
+                           lambda segmento: rede.callback(CLIENTE, SERVIDOR, segmento))
+
+    servidor = Servidor(rede, PORTA_SERVIDOR, controle)
+    dados = bytes(args.bytes)
+    conexoes = []
+    servidor.registrar_monitor_de_conexoes_aceitas(
+        lambda conexao: (conexoes.append(conexao), conexao.enviar(dados)))
+    cliente.conectar()
+
+    async def esperar():
+        while cliente.terminou_em is None and loop.time() < args.limite:
+            await asyncio.sleep(0.05)
+    loop.run_until_complete(esperar())
+    loop.close()
+
+    conexao = conexoes[0]
+    tempo = (cliente.terminou_em or loop.time())
+    return cliente.recebidos * 8 / tempo, conexao.retransmissoes_rapidas, \
+        conexao.retransmissoes_por_timeout, rede.ida.descartados
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compara o goodput dos algoritmos de controle de congestionamento')
+    parser.add_argument('--taxa', type=float, default=2e6, help='bits/s')
+    parser.add_argument('--atraso', type=float, default=0.05, help='RTT de propagação (s)')
+    parser.add_argument('--fila', type=int, default=32*1024, help='bytes')
+    parser.add_argument('--perda', type=float, default=0.005)
+    parser.add_argument('--bytes', type=int, default=4*1024*1024)
+    parser.add_argument('--limite', type=float, default=600, help='tempo virtual máximo (s)')
+    parser.add_argument('--semente', type=int, default=1)
+    args = parser.parse_args()
+
+    print('enlace: %.1f Mbit/s, RTT %d ms, fila %d B, perda %.2f%%, %d bytes' %
+          (args.taxa/1e6, args.atraso*1000, args.fila, args.perda*100, args.bytes))
+    print('%12s %16s %12s %12s %12s' % ('algoritmo', 'goodput (Mbit/s)',
+                                          'rápidas', 'timeouts', 'descartes'))
+    for sack in (False, True):
+        for controle in (Reno, NewReno, Cubic):
+            goodput, rapidas, timeouts, descartes = medir(controle, sack, args)
+            nome = controle.__name__ + ('+SACK' if sack else '')
+            print('%12s %16.3f %12d %12d %12d' % (nome, goodput/1e6,
+                                                  rapidas, timeouts, descartes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# Benchmark da busca na tabela de encaminhamento. Compara a TRIE binária
+# original, indexada por strings de '0'/'1', com ip.TabelaEncaminhamento.
+from __future__ import annotations
+import random
+import sys
+import timeit
+from ipaddress import ip_address
+
+from ip import TabelaEncaminhamento
+from tcputils import addr2str
+
+sys.setrecursionlimit(10000)
+
+
+class TRIE:
+    _content: str | None
+    _one_child: TRIE
+    _zero_child: TRIE
+
+    def __init__(self, content: str | None = None) -> None:
+        self._content = content
+        self._one_child = None
+        self._zero_child = None
+
+    def find(self, key: str):
+        found = self._content
+        found_child = None
+
+        if len(key) > 0:
+            if key[0] == '0' and self._zero_child is not None:
+                found_child = self._zero_child.find(key[1:])
+            elif key[0] == '1' and self._one_child is not None:
+                found_child = self._one_child.find(key[1:])
+
+        if found_child is not None:
+            return found_child
+        return found
+
+    def insert(self, key: str, content: str):
+        if len(key) == 0:
+            self._content = content
+            return
+
+        if key[0] == '0':
+            if self._zero_child is None:
+                self._zero_child = TRIE()
+
+            self._zero_child.insert(key[1:], content)
+        elif key[0] == '1':
+            if self._one_child is None:
+                self._one_child = TRIE()
+
+            self._one_child.insert(key[1:], content)
+
+
+def cidr_para_bitstring(cidr):
+    ip, bits = cidr.split('/')
+    ip = int.from_bytes(ip_address(ip).packed, 'big')
+    return f'{ip:032b}'[:int(bits)]
+
+
+def ipaddr_para_bitstring(ipaddr):
+    ip = int.from_bytes(ip_address(ipaddr).packed, 'big')
+    return f'{ip:032b}'
+
+
+def gerar_tabela(n):
+    # Distribuição de comprimentos parecida com a de uma tabela BGP real,
+    # dominada por /24, mais uma rota padrão
+    comprimentos = [8, 12, 16, 18, 20, 22, 23, 24, 24, 24, 24, 24, 28, 32]
+    tabela = [('0.0.0.0/0', '10.0.0.1')]
+    for i in range(n):
+        endereco = random.getrandbits(32).to_bytes(4, 'big')
+        comprimento = random.choice(comprimentos)
+        tabela.append(('%s/%d' % (addr2str(endereco), comprimento),
+                       '10.0.%d.%d' % (i >> 8 & 0xff, i & 0xff)))
+    return tabela
+
+
+def main():
+    random.seed(1)
+    print('%8s %16s %16s %16s %8s' % ('rotas', 'trie (us/busca)', 'novo (us/busca)',
+                                      'novo+str (us)', 'ganho'))
+    for n in (10000, 30000, 100000):
+        tabela = gerar_tabela(n)
+        trie = TRIE()
+        for cidr, next_hop in tabela:
+            trie.insert(cidr_para_bitstring(cidr), next_hop)
+        nova = TabelaEncaminhamento(tabela)
+
+        # Metade dos destinos dentro de prefixos da tabela, metade aleatórios
+        destinos = [cidr.split('/')[0] for cidr, _ in random.sample(tabela, 500)]
+        destinos += [addr2str(random.getrandbits(32).to_bytes(4, 'big'))
+                     for _ in range(500)]
+        destinos_int = [int.from_bytes(ip_address(d).packed, 'big') for d in destinos]
+
+        for destino, destino_int in zip(destinos, destinos_int):
+            assert trie.find(ipaddr_para_bitstring(destino)) == nova.buscar(destino_int)
+
+        t_trie = min(timeit.repeat(
+            lambda: [trie.find(ipaddr_para_bitstring(d)) for d in destinos],
+            number=3, repeat=3)) / 3 / len(destinos)
+        t_novo = min(timeit.repeat(
+            lambda: [nova.buscar(d) for d in destinos_int],
+            number=30, repeat=3)) / 30 / len(destinos)
+        t_novo_str = min(timeit.repeat(
+            lambda: [nova.buscar(int.from_bytes(bytes(map(int, d.split('.'))), 'big'))
+                     for d in destinos],
+            number=30, repeat=3)) / 30 / len(destinos)
+        print('%8d %16.2f %16.2f %16.2f %7.1fx' % (n, t_trie*1e6, t_novo*1e6,
+                                                   t_novo_str*1e6, t_trie/t_novo))
+
+
+if __name__ == '__main__':
+    main()
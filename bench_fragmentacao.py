@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Mede o custo de fragmentar datagramas para o MTU do próximo enlace e de
+# remontá-los no destino, e o comportamento do cache de remontagem sob uma
+# enxurrada de fragmentos que nunca se completam.
+import os
+import random
+import struct
+import timeit
+
+from ip import IP, CacheRemontagem, TAM_MAX_REMONTAGEM, TEMPO_REMONTAGEM, FLAG_MF
+
+ORIGEM = '10.0.0.1'
+ROTEADOR = '10.0.0.254'
+DESTINO = '10.0.1.1'
+REPETICOES = 2000
+FRAGMENTOS_FALSOS = 100000
+
+
+class Enlace:
+    ignore_checksum = False
+
+    def registrar_recebedor(self, callback):
+        self.callback = callback
+
+    def enviar(self, datagrama, next_hop):
+        self.saida.append(datagrama)
+
+
+def criar_ip(endereco, rota):
+    enlace = Enlace()
+    enlace.saida = []
+    rede = IP(enlace)
+    rede.definir_endereco_host(endereco)
+    rede.definir_tabela_encaminhamento([('0.0.0.0/0', rota)])
+    return rede, enlace
+
+
+def medir(tamanho, mtu):
+    origem, enlace_origem = criar_ip(ORIGEM, ROTEADOR)
+    origem.definir_mtu(ROTEADOR, mtu)
+    destino, enlace_destino = criar_ip(DESTINO, ROTEADOR)
+    recebidos = []
+    destino.registrar_recebedor(lambda src, dst, payload: recebidos.append(len(payload)))
+    segmento = os.urandom(tamanho)
+
+    inicio = timeit.default_timer()
+    for _ in range(REPETICOES):
+        origem.enviar(segmento, DESTINO)
+    fragmentar = timeit.default_timer() - inicio
+    fragmentos = enlace_origem.saida
+    por_datagrama = len(fragmentos) // REPETICOES
+
+    inicio = timeit.default_timer()
+    for fragmento in fragmentos:
+        enlace_destino.callback(fragmento)
+    remontar = timeit.default_timer() - inicio
+    assert recebidos == [tamanho] * REPETICOES
+    return por_datagrama, REPETICOES / fragmentar, REPETICOES / remontar
+
+
+def enxurrada():
+    """
+    Fragmentos iniciais de datagramas diferentes, que nunca se completam,
+    seguidos de um datagrama legítimo em dois fragmentos
+    """
+    cache = CacheRemontagem(TAM_MAX_REMONTAGEM, TEMPO_REMONTAGEM)
+    dados = bytes(1024)
+    maior = 0
+    inicio = timeit.default_timer()
+    for i in range(FRAGMENTOS_FALSOS):
+        cache.adicionar((random.getrandbits(32), 1, i & 0xffff, 6), 0, FLAG_MF, dados)
+        maior = max(maior, cache.bytes_armazenados)
+    tempo = timeit.default_timer() - inicio
+    chave = (1, 2, 3, 6)
+    cache.adicionar(chave, 0, FLAG_MF, dados)
+    completo = cache.adicionar(chave, len(dados), 0, b'fim') is not None
+    return FRAGMENTOS_FALSOS / tempo, maior, cache.descartados, completo
+
+
+def main():
+    print('%d datagramas de cada tamanho' % REPETICOES)
+    print('%8s %6s %12s %16s %16s' % ('tamanho', 'MTU', 'fragmentos', 'fragmentar/s',
+                                      'remontar/s'))
+    for tamanho in (1400, 8192, 60000):
+        for mtu in (1500, 576, 296):
+            fragmentos, fragmentar, remontar = medir(tamanho, mtu)
+            print('%8d %6d %12d %16.0f %16.0f' % (tamanho, mtu, fragmentos,
+                                                  fragmentar, remontar))
+
+    taxa, maior, descartados, completo = enxurrada()
+    print()
+    print('%d fragmentos que nunca se completam: %.0f/s, no máximo %d bytes guardados '
+          '(limite %d), %d datagramas descartados, datagrama legítimo remontado: %s' %
+          (FRAGMENTOS_FALSOS, taxa, maior, TAM_MAX_REMONTAGEM, descartados,
+           'sim' if completo else 'não'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Microbenchmark da codificação e decodificação de quadros SLIP. Compara as
+# implementações byte-a-byte originais com as de slip.py e, na recepção, com o
+# tempo que os mesmos bytes levariam para atravessar uma serial de 115200 baud.
+import os
+import timeit
+
+from slip import Enlace, codificar_quadro
+
+# 8N1: cada byte ocupa 10 bits na linha
+SEGUNDOS_POR_BYTE_SERIAL = 10 / 115200
+
+
+def codificar_quadro_antigo(datagrama):
+    quadro = b''
+    for byte in bytearray(datagrama):
+        byte = byte.to_bytes(1, 'big', signed=False)
+
+        if byte == b'\xC0':
+            quadro = quadro + b'\xDB\xDC'
+        elif byte == b'\xDB':
+            quadro = quadro + b'\xDB\xDD'
+        else:
+            quadro = quadro + byte
+
+    return b'\xC0' + quadro + b'\xC0'
+
+
+class DecodificadorAntigo:
+    def __init__(self):
+        self.buffer = b''
+        self.estado = 0
+        self.quadros = 0
+
+    def receber(self, dados):
+        for byte in dados:
+            byte = byte.to_bytes(1, 'big', signed=False)
+            if self.estado == 0:
+                if byte == b'\xDB':
+                    self.estado = 2
+                elif byte == b'\xC0':
+                    self.estado = 1
+                else:
+                    self.buffer = self.buffer + byte
+                    self.estado = 1
+            elif self.estado == 1:
+                if byte == b'\xC0':
+                    if len(self.buffer) > 0:
+                        self.quadros += 1
+                    self.buffer = b''
+                    self.estado = 0
+                elif byte == b'\xDB':
+                    self.estado = 2
+                else:
+                    self.buffer = self.buffer + byte
+            elif self.estado == 2:
+                if byte == b'\xDC':
+                    self.buffer = self.buffer + b'\xC0'
+                elif byte == b'\xDD':
+                    self.buffer = self.buffer + b'\xDB'
+                self.estado = 1
+
+
+class LinhaFalsa:
+    def registrar_recebedor(self, callback):
+        self.callback = callback
+
+    def enviar(self, dados):
+        pass
+
+
+def medir(funcao, repeticoes):
+    return min(timeit.repeat(funcao, number=repeticoes, repeat=5)) / repeticoes
+
+
+def main():
+    print('%8s %14s %14s %14s %8s' % ('tamanho', 'antigo (us)', 'novo (us)',
+                                      'reuso (us)', 'ganho'))
+    for tamanho in (64, 576, 1500):
+        datagrama = os.urandom(tamanho)
+        assert bytes(codificar_quadro(datagrama)) == codificar_quadro_antigo(datagrama)
+
+        saida = bytearray()
+        def com_reuso():
+            del saida[:]
+            codificar_quadro(memoryview(datagrama), saida)
+
+        antigo = medir(lambda: codificar_quadro_antigo(datagrama), 200)
+        novo = medir(lambda: codificar_quadro(datagrama), 20000)
+        reuso = medir(com_reuso, 20000)
+        print('%8d %14.2f %14.2f %14.2f %7.1fx' % (tamanho, antigo*1e6, novo*1e6,
+                                                   reuso*1e6, antigo/novo))
+
+    # Recepção: um fluxo contínuo de quadros entregue em pedaços de 2048 bytes,
+    # como a PTY faz em camadafisica.py
+    print()
+    print('%8s %14s %14s %14s %8s' % ('tamanho', 'antigo (us)', 'novo (us)',
+                                      'serial (us)', 'ganho'))
+    for tamanho in (64, 576, 1500):
+        fluxo = b''.join(bytes(codificar_quadro(os.urandom(tamanho)))
+                         for _ in range(100))
+        pedacos = [fluxo[i:i+2048] for i in range(0, len(fluxo), 2048)]
+
+        linha = LinhaFalsa()
+        enlace = Enlace(linha)
+        enlace.registrar_recebedor(lambda quadro: None)
+        def decodificar_novo():
+            for pedaco in pedacos:
+                linha.callback(pedaco)
+        def decodificar_antigo():
+            decodificador = DecodificadorAntigo()
+            for pedaco in pedacos:
+                decodificador.receber(pedaco)
+
+        antigo = medir(decodificar_antigo, 2) / 100
+        novo = medir(decodificar_novo, 200) / 100
+        serial = len(fluxo) / 100 * SEGUNDOS_POR_BYTE_SERIAL
+        print('%8d %14.2f %14.2f %14.2f %7.1fx' % (tamanho, antigo*1e6, novo*1e6,
+                                                   serial*1e6, antigo/novo))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Mede o custo de uma rajada de SYNs com endereços forjados em um Servidor
+# cuja fila de conexões semiabertas é praticamente ilimitada (todo SYN
+# guarda estado) e em um com a fila padrão, que passa a responder com SYN
+# cookies quando ela enche. No fim, um cliente legítimo completa o
+# handshake para confirmar que a conexão ainda é aceita.
+import asyncio
+import timeit
+import tracemalloc
+
+from tcp import Servidor, BACKLOG_SYN, montar_cabecalho
+from tcputils import *
+
+SYNS = 50000
+PORTA_SERVIDOR = 80
+SERVIDOR = '10.0.0.1'
+
+
+class Rede:
+    ignore_checksum = True
+
+    def registrar_recebedor(self, callback):
+        self.callback = callback
+
+    def enviar(self, segmento, dest_addr):
+        self.ultimo = segmento
+
+
+def origem(i):
+    return '10.%d.%d.%d' % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff)
+
+
+def medir(backlog):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    rede = Rede()
+    servidor = Servidor(rede, PORTA_SERVIDOR, backlog=backlog)
+    aceitas = []
+    servidor.registrar_monitor_de_conexoes_aceitas(aceitas.append)
+    syns = [(origem(i), montar_cabecalho(1024 + i % 60000, PORTA_SERVIDOR, i, 0, FLAGS_SYN))
+            for i in range(SYNS)]
+
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    inicio = timeit.default_timer()
+    for src_addr, segmento in syns:
+        rede.callback(src_addr, SERVIDOR, segmento)
+    tempo = timeit.default_timer() - inicio
+    memoria = tracemalloc.get_traced_memory()[0] - antes
+    tracemalloc.stop()
+
+    # Cliente legítimo depois da rajada
+    cliente = '192.168.0.1'
+    rede.callback(cliente, SERVIDOR, montar_cabecalho(5555, PORTA_SERVIDOR, 1000, 0, FLAGS_SYN))
+    iss = read_header(rede.ultimo)[2]
+    rede.callback(cliente, SERVIDOR, montar_cabecalho(5555, PORTA_SERVIDOR, 1001, iss + 1,
+                                                      FLAGS_ACK))
+    resultado = (SYNS / tempo, memoria / SYNS, len(servidor.semiabertas),
+                 servidor.cookies_enviados, len(aceitas) == 1)
+    loop.close()
+    return resultado
+
+
+def main():
+    print('%d SYNs forjados' % SYNS)
+    print('%10s %10s %12s %12s %10s %10s' % ('backlog', 'SYNs/s', 'bytes/SYN',
+                                             'semiabertas', 'cookies', 'aceitou'))
+    for backlog in (SYNS + 1, BACKLOG_SYN):
+        taxa, memoria, semiabertas, cookies, aceitou = medir(backlog)
+        print('%10d %10.0f %12.1f %12d %10d %10s' % (backlog, taxa, memoria, semiabertas,
+                                                     cookies, 'sim' if aceitou else 'não'))
+
+
+if __name__ == '__main__':
+    main()
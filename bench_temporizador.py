@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Compara o custo de rearmar o timer de retransmissão a cada ACK usando um
+# call_later do asyncio por conexão (cancelando o anterior) e usando a
+# RodaTemporizadores compartilhada. Mede também quantas entradas ficam no
+# heap de timers do laço de eventos.
+import asyncio
+import random
+import timeit
+
+from temporizador import RodaTemporizadores
+
+CONEXOES = 5000
+ACKS = 200000
+RTO = 0.5
+
+
+def medir_call_later(loop):
+    handles = [None] * CONEXOES
+    callback = lambda: None
+    inicio = timeit.default_timer()
+    for _ in range(ACKS):
+        i = random.randrange(CONEXOES)
+        if handles[i] is not None:
+            handles[i].cancel()
+        handles[i] = loop.call_later(RTO, callback)
+    tempo = timeit.default_timer() - inicio
+    heap = len(loop._scheduled)
+    for handle in handles:
+        handle.cancel()
+    return tempo, heap
+
+
+def medir_roda(loop):
+    roda = RodaTemporizadores()
+    timers = [roda.criar(lambda: None) for _ in range(CONEXOES)]
+    inicio = timeit.default_timer()
+    for _ in range(ACKS):
+        timers[random.randrange(CONEXOES)].armar(RTO)
+    tempo = timeit.default_timer() - inicio
+    heap = len(loop._scheduled)
+    for timer in timers:
+        timer.desarmar()
+    return tempo, heap
+
+
+def main():
+    print('%d conexões, %d rearmes do RTO' % (CONEXOES, ACKS))
+    print('%12s %14s %16s' % ('', 'rearmes/s', 'entradas no heap'))
+    for nome, medir in (('call_later', medir_call_later), ('roda', medir_roda)):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        random.seed(1)
+        tempo, heap = medir(loop)
+        print('%12s %14.0f %16d' % (nome, ACKS / tempo, heap))
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
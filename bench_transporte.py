@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# Compara um produtor rápido que entrega tudo a Conexao.enviar de uma vez
+# com um que escreve por um StreamWriter de transporte.py e espera drain(),
+# em um enlace lento emulado. Mede o maior número de bytes parados no
+# buffer de envio e o goodput, que deve ser o mesmo nos dois casos.
+import argparse
+import asyncio
+import random
+
+from bench_congestionamento import LacoVirtual, Enlace, Cliente, Rede, CLIENTE, SERVIDOR, \
+    PORTA_SERVIDOR
+from congestionamento import NewReno
+from tcp import Servidor
+from transporte import servir, LIMITE_ESCRITA
+
+BLOCO = 16 * 1024
+
+
+def medir(com_drain, args):
+    random.seed(args.semente)
+    loop = LacoVirtual()
+    asyncio.set_event_loop(loop)
+
+    rede = Rede()
+    cliente = Cliente(loop, args.bytes, True)
+    rede.ida = Enlace(loop, args.taxa / 8, args.atraso / 2, args.fila,
+                      args.perda, cliente.receber)
+    cliente.volta = Enlace(loop, args.taxa / 8, args.atraso / 2, args.fila, 0,
+                           lambda segmento: rede.callback(CLIENTE, SERVIDOR, segmento))
+    servidor = Servidor(rede, PORTA_SERVIDOR, NewReno)
+    pico = [0]
+
+    async def produtor(reader, writer):
+        bloco = bytes(BLOCO)
+        for _ in range(args.bytes // BLOCO):
+            writer.write(bloco)
+            pico[0] = max(pico[0], writer.transport.get_write_buffer_size())
+            if com_drain:
+                await writer.drain()
+
+    def sem_drain(conexao):
+        bloco = bytes(BLOCO)
+        for _ in range(args.bytes // BLOCO):
+            conexao.enviar(bloco)
+            pico[0] = max(pico[0], conexao.bytes_no_buffer_de_envio())
+
+    if com_drain:
+        servir(servidor, produtor)
+    else:
+        servidor.registrar_monitor_de_conexoes_aceitas(sem_drain)
+    cliente.conectar()
+
+    async def esperar():
+        while cliente.terminou_em is None and loop.time() < args.limite:
+            await asyncio.sleep(0.05)
+    loop.run_until_complete(esperar())
+    loop.close()
+
+    tempo = cliente.terminou_em or loop.time()
+    return pico[0], cliente.recebidos * 8 / tempo
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compara o buffer de envio com e sem StreamWriter.drain')
+    parser.add_argument('--taxa', type=float, default=1e6, help='bits/s')
+    parser.add_argument('--atraso', type=float, default=0.05, help='RTT de propagação (s)')
+    parser.add_argument('--fila', type=int, default=32*1024, help='bytes')
+    parser.add_argument('--perda', type=float, default=0.001)
+    parser.add_argument('--bytes', type=int, default=8*1024*1024)
+    parser.add_argument('--limite', type=float, default=600, help='tempo virtual máximo (s)')
+    parser.add_argument('--semente', type=int, default=1)
+    args = parser.parse_args()
+
+    print('enlace: %.1f Mbit/s, RTT %d ms, fila %d B, perda %.2f%%, %d bytes, '
+          'limite de escrita %d B' % (args.taxa/1e6, args.atraso*1000, args.fila,
+                                      args.perda*100, args.bytes, LIMITE_ESCRITA))
+    print('%14s %22s %18s' % ('produtor', 'pico no buffer (B)', 'goodput (Mbit/s)'))
+    for com_drain in (False, True):
+        pico, goodput = medir(com_drain, args)
+        print('%14s %22d %18.3f' % ('drain()' if com_drain else 'enviar()', pico,
+                                    goodput/1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,11 +2,18 @@ import os
 import mmap
 import errno
 import fcntl
-import struct
 import termios
 import asyncio
 import traceback
-from collections import defaultdict
+from collections import defaultdict, deque
+
+# Quantidade máxima de bytes escritos em cada porta a cada rodada de envio,
+# para que um quadro grande não monopolize o laço de eventos
+ORCAMENTO_TX = 2048
+# Quantidade máxima de palavras retiradas da fila de recepção do hardware a
+# cada chamada, no estilo NAPI. O restante é drenado em uma nova chamada
+# agendada no laço de eventos, para não atrasar timers e outras leituras
+ORCAMENTO_RX = 1024
 
 
 class ZyboSerialDriver:
@@ -16,7 +23,21 @@ class ZyboSerialDriver:
         self.fd = os.open(device, os.O_RDWR)
         fcntl.fcntl(self.fd, fcntl.F_SETFL, os.O_NONBLOCK)
         self.mm = mmap.mmap(self.fd, 0x1000)
-        asyncio.get_event_loop().add_reader(self.fd, self.__irq_handler)
+        # Registradores da página mapeada vistos como palavras de 32 bits
+        self.regs = memoryview(self.mm).cast('I')
+        # Registrador 0, lido com sinal, retira um elemento da fila de recepção
+        self.fila_rx = memoryview(self.mm).cast('i')
+        # Buffers de recepção de cada porta, reaproveitados entre interrupções
+        self.buffers_rx = defaultdict(bytearray)
+        # Estatísticas da recepção
+        self.irqs = 0
+        self.palavras_drenadas = 0
+        self.orcamento_rx_esgotado = 0
+        # Fila de envio em software de cada porta
+        self.filas_tx = defaultdict(deque)
+        self.__tx_agendado = False
+        self.loop = asyncio.get_event_loop()
+        self.loop.add_reader(self.fd, self.__irq_handler)
         self.__irq_unmask()
         self.callbacks = defaultdict(lambda: lambda _: None)
 
@@ -33,27 +54,99 @@ class ZyboSerialDriver:
 
     def enviar(self, port, data):
         #print('send', port, data)
+        fila = self.filas_tx[port]
+        if fila:
+            # Ainda há dados anteriores aguardando, preserva a ordem
+            fila.append(data)
+            return
+        escritos = self.__escrever(port, data, ORCAMENTO_TX)
+        if escritos < len(data):
+            fila.append(memoryview(data)[escritos:])
+            self.__agendar_tx()
+
+    def __escrever(self, port, data, limite):
+        """
+        Escreve até limite bytes de data no registrador de envio da porta,
+        um byte por palavra, e retorna quantos bytes foram escritos
+        """
+        if len(data) > limite:
+            data = memoryview(data)[:limite]
+        regs = self.regs
         for b in data:
-            self.mm[port*4:port*4+4] = struct.pack('I', b)
+            regs[port] = b
+        return len(data)
+
+    def __agendar_tx(self):
+        if not self.__tx_agendado:
+            self.__tx_agendado = True
+            self.loop.call_soon(self.__drenar_tx)
+
+    def __drenar_tx(self):
+        """
+        Escreve no hardware até ORCAMENTO_TX bytes da fila de cada porta e,
+        se ainda sobrarem dados, agenda uma nova rodada
+        """
+        self.__tx_agendado = False
+        pendente = False
+        for port, fila in self.filas_tx.items():
+            orcamento = ORCAMENTO_TX
+            while fila and orcamento > 0:
+                data = fila.popleft()
+                escritos = self.__escrever(port, data, orcamento)
+                orcamento -= escritos
+                if escritos < len(data):
+                    fila.appendleft(memoryview(data)[escritos:])
+            pendente = pendente or len(fila) > 0
+        if pendente:
+            self.__agendar_tx()
 
     def registrar_recebedor(self, port, callback):
         self.callbacks[port] = callback
 
     def __irq_handler(self):
         os.read(self.fd, 4)   # diz ao SO que coletamos a irq
-        buffers = defaultdict(lambda: bytearray())
-        while True:
-            elem, = struct.unpack('i', self.mm[0:4])  # retira da fila do hardware
-            if elem == -1: break                      # fila vazia
-            port, b = elem>>8, elem&0xff
-            buffers[port].append(b)
+        self.irqs += 1
+        self.__drenar_rx()
+
+    def __drenar_rx(self):
+        """
+        Retira até ORCAMENTO_RX palavras da fila do hardware e as entrega às
+        portas. Se o orçamento acabar, continua em uma nova chamada agendada
+        em vez de reabilitar a irq.
+        """
+        fila_rx = self.fila_rx
+        buffers = self.buffers_rx
+        palavras = 0
+        while palavras < ORCAMENTO_RX:
+            elem = fila_rx[0]          # retira da fila do hardware
+            if elem == -1: break       # fila vazia
+            buffers[elem>>8].append(elem&0xff)
+            palavras += 1
+        self.palavras_drenadas += palavras
+
         for port, dados in buffers.items():
+            if not dados:
+                continue
             try:
                 #print('recv', port, dados)
                 self.callbacks[port](bytes(dados))
             except:
                 traceback.print_exc()
-        self.__irq_unmask()
+            dados.clear()
+
+        if palavras == ORCAMENTO_RX:
+            self.orcamento_rx_esgotado += 1
+            self.loop.call_soon(self.__drenar_rx)
+        else:
+            self.__irq_unmask()
+
+    def palavras_por_irq(self):
+        """
+        Média de palavras retiradas da fila de recepção por interrupção
+        """
+        if self.irqs == 0:
+            return 0
+        return self.palavras_drenadas / self.irqs
 
     def __irq_unmask(self):
         os.write(self.fd, b'\x01\x00\x00\x00')
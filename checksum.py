@@ -0,0 +1,83 @@
+import struct
+
+from tcputils import str2addr
+
+
+def dobrar(valor):
+    """
+    Reduz uma soma de palavras de 16 bits de qualquer tamanho à soma em
+    complemento de um correspondente, entre 1 e 0xffff (ou 0 se valor for 0).
+    """
+    if valor == 0:
+        return 0
+    return (valor - 1) % 0xffff + 1
+
+
+def somar(dados, soma=0):
+    """
+    Soma em complemento de um (ainda não invertida) das palavras de 16 bits
+    dos dados, acumulada sobre uma soma anterior. Os dados podem ser bytes,
+    bytearray ou memoryview e são lidos de uma só vez como um inteiro.
+
+    Como 2**16 deixa resto 1 na divisão por 0xffff, o inteiro formado por
+    todos os bytes é congruente à soma das suas palavras, e o resto da
+    divisão por 0xffff faz todo o "end-around carry" de uma vez. O resultado
+    fica entre 1 e 0xffff, ou é 0 se todas as palavras forem zero, assim como
+    na soma palavra a palavra.
+    """
+    valor = int.from_bytes(dados, 'big')
+    if len(dados) % 2 == 1:
+        # se for ímpar, faz padding à direita
+        valor <<= 8
+    return dobrar(valor + soma)
+
+
+def somar_pseudocabecalho(src_addr, dst_addr, tamanho, soma=0):
+    """
+    Acrescenta à soma o pseudocabeçalho TCP. Os endereços podem ser strings
+    (no formato x.y.z.w) ou inteiros de 32 bits.
+    """
+    if isinstance(src_addr, str):
+        src_addr, = struct.unpack('!I', str2addr(src_addr))
+    if isinstance(dst_addr, str):
+        dst_addr, = struct.unpack('!I', str2addr(dst_addr))
+    return dobrar((src_addr >> 16) + (src_addr & 0xffff) +
+                  (dst_addr >> 16) + (dst_addr & 0xffff) +
+                  0x0006 + tamanho + soma)
+
+
+def calc_checksum(segment, src_addr=None, dst_addr=None):
+    """
+    Calcula o checksum complemento-de-um (formato do TCP e do UDP) para os
+    dados fornecidos, com o mesmo resultado de tcputils.calc_checksum, mas
+    somando o buffer inteiro de uma só vez.
+
+    Se os endereços IPv4 de origem e de destino forem passados, o
+    pseudocabeçalho é incluído no cálculo.
+    """
+    soma = somar(segment)
+    if src_addr is not None or dst_addr is not None:
+        soma = somar_pseudocabecalho(src_addr, dst_addr, len(segment), soma)
+    return ~soma & 0xffff
+
+
+def atualizar_checksum(checksum, antigo, novo):
+    """
+    Atualiza de forma incremental um checksum quando uma palavra de 16 bits
+    dos dados muda de antigo para novo, sem somar os dados novamente.
+    Usa a equação 3 da RFC 1624: HC' = ~(~HC + ~m + m').
+    """
+    soma = (~checksum & 0xffff) + (~antigo & 0xffff) + novo
+    soma = (soma & 0xffff) + (soma >> 16)
+    soma = (soma & 0xffff) + (soma >> 16)
+    return ~soma & 0xffff
+
+
+def fix_checksum(segment, src_addr, dst_addr):
+    """
+    Corrige o checksum de um segmento TCP.
+    """
+    seg = bytearray(segment)
+    seg[16:18] = b'\x00\x00'
+    struct.pack_into('!H', seg, 16, calc_checksum(seg, src_addr, dst_addr))
+    return bytes(seg)
@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+
+from tcputils import MSS
+
+
+class ControleCongestionamento(ABC):
+    """
+    Interface dos algoritmos de controle de congestionamento usados por
+    tcp.Conexao. A janela de congestionamento (cwnd) e o limiar de partida
+    lenta (ssthresh) são mantidos em bytes. A Conexao chama os métodos ao_*
+    nos eventos correspondentes, e cada algoritmo decide como a janela muda.
+    Os algoritmos implementam pelo menos os métodos abstratos.
+    """
+    # Se True, a recuperação rápida só termina quando todos os dados em voo
+    # no momento da perda forem reconhecidos, e cada ACK parcial retransmite
+    # o próximo buraco (NewReno). Se False, termina no primeiro ACK novo.
+    recuperacao_newreno = False
+
+    def __init__(self, mss=MSS):
+        self.mss = mss
+        self.cwnd = mss
+        self.ssthresh = float('inf')
+        self.rtt_minimo = None
+
+    @abstractmethod
+    def ao_receber_ack(self, bytes_reconhecidos, agora):
+        """
+        Chamado a cada ACK que reconhece dados novos fora da recuperação rápida
+        """
+
+    @abstractmethod
+    def ao_detectar_perda(self, bytes_em_voo, agora):
+        """
+        Chamado no terceiro ACK duplicado, ao entrar na recuperação rápida.
+        Sem SACK, a Conexao infla a janela em seguida chamando ao_ack_duplicado
+        uma vez para cada um dos três ACKs duplicados.
+        """
+
+    def ao_ack_duplicado(self):
+        """
+        Chamado a cada ACK duplicado adicional durante a recuperação rápida,
+        quando a conexão não usa SACK
+        """
+        # Cada ACK duplicado indica que um segmento saiu da rede
+        self.cwnd += self.mss
+
+    def ao_ack_parcial(self, bytes_reconhecidos):
+        """
+        Chamado em um ACK parcial durante a recuperação rápida (NewReno)
+        """
+        # Desinfla a janela do que saiu da rede, mas permite enviar o
+        # segmento retransmitido
+        self.cwnd = max(self.mss, self.cwnd - bytes_reconhecidos + self.mss)
+
+    def ao_sair_da_recuperacao(self):
+        """
+        Chamado quando a recuperação rápida termina
+        """
+        self.cwnd = self.ssthresh
+
+    @abstractmethod
+    def ao_estourar_timeout(self, bytes_em_voo, agora):
+        """
+        Chamado quando o timer de retransmissão expira
+        """
+
+    def ao_medir_rtt(self, amostra):
+        """
+        Chamado a cada nova amostra de RTT
+        """
+        if self.rtt_minimo is None or amostra < self.rtt_minimo:
+            self.rtt_minimo = amostra
+
+
+class Reno(ControleCongestionamento):
+    """
+    Partida lenta, prevenção de congestionamento com crescimento de 1 MSS por
+    RTT e redução da janela pela metade na perda (RFC 5681).
+    """
+    def ao_receber_ack(self, bytes_reconhecidos, agora):
+        if self.cwnd < self.ssthresh:
+            # Partida lenta, limitada a 1 MSS por ACK (RFC 3465)
+            self.cwnd += min(bytes_reconhecidos, self.mss)
+        else:
+            # Prevenção de congestionamento
+            self.cwnd += max(1, self.mss * self.mss // self.cwnd)
+
+    def ao_detectar_perda(self, bytes_em_voo, agora):
+        self.ssthresh = max(bytes_em_voo // 2, 2 * self.mss)
+        self.cwnd = self.ssthresh
+
+    def ao_estourar_timeout(self, bytes_em_voo, agora):
+        self.ssthresh = max(bytes_em_voo // 2, 2 * self.mss)
+        self.cwnd = self.mss
+
+
+class NewReno(Reno):
+    """
+    Reno com a recuperação rápida da RFC 6582
+    """
+    recuperacao_newreno = True
+
+
+class Cubic(NewReno):
+    """
+    CUBIC (RFC 9438): depois de uma perda, a janela cresce seguindo uma função
+    cúbica do tempo desde a perda, centrada na janela em que ela ocorreu, e
+    nunca mais devagar do que cresceria com Reno.
+    """
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, mss=MSS):
+        super().__init__(mss)
+        self.w_max = 0.0          # janela (em MSS) na última perda
+        self.inicio_epoca = None
+        self.k = 0.0
+        self.w_est = 0.0          # janela estimada de Reno (em MSS)
+
+    def ao_receber_ack(self, bytes_reconhecidos, agora):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += min(bytes_reconhecidos, self.mss)
+            return
+
+        cwnd = self.cwnd / self.mss
+        if self.inicio_epoca is None:
+            self.inicio_epoca = agora
+            if cwnd < self.w_max:
+                self.k = ((self.w_max - cwnd) / self.C) ** (1/3)
+            else:
+                self.k = 0.0
+                self.w_max = cwnd
+            self.w_est = cwnd
+
+        rtt = self.rtt_minimo or 0.0
+        t = agora - self.inicio_epoca + rtt
+        alvo = self.w_max + self.C * (t - self.k) ** 3
+        # Região amigável ao Reno
+        self.w_est += 3 * (1 - self.BETA) / (1 + self.BETA) * \
+            bytes_reconhecidos / self.cwnd
+        alvo = max(alvo, self.w_est)
+
+        if alvo > cwnd:
+            # Cresce no máximo 50% por RTT
+            alvo = min(alvo, 1.5 * cwnd)
+            self.cwnd += max(1, int(self.mss * (alvo - cwnd) / cwnd))
+        else:
+            self.cwnd += max(1, self.mss // (100 * int(cwnd)))
+
+    def _reduzir(self):
+        cwnd = self.cwnd / self.mss
+        if cwnd < self.w_max:
+            # Convergência rápida: libera banda para fluxos novos
+            self.w_max = cwnd * (1 + self.BETA) / 2
+        else:
+            self.w_max = cwnd
+        self.inicio_epoca = None
+        self.ssthresh = max(int(self.cwnd * self.BETA), 2 * self.mss)
+
+    def ao_detectar_perda(self, bytes_em_voo, agora):
+        self._reduzir()
+        self.cwnd = self.ssthresh
+
+    def ao_estourar_timeout(self, bytes_em_voo, agora):
+        self._reduzir()
+        self.cwnd = self.mss
@@ -1,10 +1,38 @@
 from __future__ import annotations
-from ipaddress import ip_address
+from collections import OrderedDict
 import struct
+import time
 from random import randint
 
 from iputils import *
 from tcputils import *
+from checksum import calc_checksum, atualizar_checksum, somar, dobrar
+
+# Quantidade de destinos mantidos no cache de rotas
+TAM_CACHE_ROTAS = 256
+# Quantidade de modelos de cabeçalho IPv4 mantidos em cache
+TAM_CACHE_MODELOS = 256
+# Quantidade de endereços já formatados como string mantidos em cache
+TAM_CACHE_ENDERECOS = 1024
+# MTU dos enlaces cujo next_hop não teve um MTU definido com definir_mtu
+MTU_PADRAO = 1500
+# Menor MTU que todo enlace IPv4 precisa suportar (RFC 791)
+MTU_MINIMO = 68
+# Memória máxima (bytes) ocupada por fragmentos à espera de remontagem
+TAM_MAX_REMONTAGEM = 256 * 1024
+# Custo (bytes) cobrado de cada datagrama incompleto além dos dados que ele
+# guarda, para que fragmentos sem dados também contem no limite acima
+CUSTO_DATAGRAMA_INCOMPLETO = 256
+# Tempo máximo (s) para que cheguem todos os fragmentos de um datagrama
+TEMPO_REMONTAGEM = 30
+# Campo de flags e offset do fragmento do cabeçalho IPv4
+FLAG_DF = 0x4000
+FLAG_MF = 0x2000
+MASCARA_OFFSET = 0x1fff
+# Bit das opções IPv4 que devem ser copiadas para todos os fragmentos
+OPCAO_COPIADA = 0x80
+# Maior payload possível de um datagrama IPv4
+TAM_MAX_PAYLOAD = 0xffff - 20
 
 class IP:
     def __init__(self, enlace):
@@ -18,43 +46,111 @@ class IP:
         self.enlace.registrar_recebedor(self.__raw_recv)
         self.ignore_checksum = self.enlace.ignore_checksum
         self.meu_endereco = None
+        self._meu_endereco_int = None
         self.identification = randint(0, 2**16 - 1)
+        self._tabela_encaminhamento = TabelaEncaminhamento()
+        self.cache_rotas = CacheRotas(TAM_CACHE_ROTAS)
+        self._modelos_cabecalho = {}
+        self._mtus = {}
+        self.remontagem = CacheRemontagem(TAM_MAX_REMONTAGEM, TEMPO_REMONTAGEM)
 
     def __raw_recv(self, datagrama):
-        dscp, ecn, identification, flags, frag_offset, ttl, proto, \
-           src_addr, dst_addr, payload = read_ipv4_header(datagrama)
-        if dst_addr == self.meu_endereco:
+        tam_cabecalho, total_len, identification, flagsfrag, ttl, proto, \
+            src_addr, dst_addr = ler_cabecalho_ipv4(datagrama)
+        if dst_addr == self._meu_endereco_int:
             # atua como host
             if proto == IPPROTO_TCP and self.callback:
-                self.callback(src_addr, dst_addr, payload)
+                payload = memoryview(datagrama)[tam_cabecalho:total_len]
+                if flagsfrag & (FLAG_MF | MASCARA_OFFSET):
+                    # Fragmento: o payload só sobe quando o datagrama estiver
+                    # completo
+                    payload = self.remontagem.adicionar(
+                        (src_addr, dst_addr, identification, proto),
+                        8 * (flagsfrag & MASCARA_OFFSET), flagsfrag & FLAG_MF, payload)
+                    if payload is None:
+                        return
+                # Os endereços só viram strings aqui, ao serem entregues
+                # à camada de cima
+                self.callback(_int2addr(src_addr), self.meu_endereco, payload)
         else:
             # atua como roteador
             next_hop = self._next_hop(dst_addr)
             novo_ttl = ttl - 1
-            tam_cabecalho = len(datagrama) - len(payload)
 
             if novo_ttl > 0:
-                datagrama = bytearray(datagrama)
-                datagrama[8:9] = struct.pack('!B', novo_ttl)
-                datagrama[10:12] = b'\x00\x00'
+                # O datagrama é alterado no lugar e repassado sem cópias
+                # quando a camada de enlace já o entrega como bytearray
+                if not isinstance(datagrama, bytearray):
+                    datagrama = bytearray(datagrama)
+                datagrama[8] = novo_ttl
+
+                if self.ignore_checksum:
+                    # O checksum recebido não é confiável, recalcula do zero
+                    datagrama[10:12] = b'\x00\x00'
+                    checksum = calc_checksum(memoryview(datagrama)[:tam_cabecalho])
+                else:
+                    # Só o TTL mudou, então basta atualizar o checksum de
+                    # forma incremental (RFC 1624)
+                    checksum, = struct.unpack_from('!H', datagrama, 10)
+                    checksum = atualizar_checksum(checksum, (ttl << 8) | proto,
+                                                  (novo_ttl << 8) | proto)
+                struct.pack_into('!H', datagrama, 10, checksum)
 
-                novo_cabecalho = self._corrigir_checksum_ipv4(bytes(datagrama[:tam_cabecalho]))
-                self.enlace.enviar(novo_cabecalho + payload, next_hop)
+                mtu = self._mtus.get(next_hop, MTU_PADRAO)
+                if total_len <= mtu:
+                    self.enlace.enviar(datagrama, next_hop)
+                elif flagsfrag & FLAG_DF:
+                    # Destination unreachable, fragmentation needed
+                    self._enviar_icmp_fragmentacao(datagrama, tam_cabecalho, src_addr, mtu)
+                else:
+                    # Fragmentos são repassados sem remontagem, e os que não
+                    # cabem no próximo enlace são fragmentados de novo
+                    for fragmento in fragmentar(datagrama, tam_cabecalho, total_len, mtu):
+                        self.enlace.enviar(fragmento, next_hop)
             else: # Time exceeded
                 cabecalho_icmp = self._montar_cabecalho_icmp(11, 0, 0)
                 segmento_retorno = cabecalho_icmp + datagrama[:(tam_cabecalho + 8)]
-                cabecalho_ipv4 = self._montar_cabecalho_ipv4(
-                    src_addr, 
+                datagrama_retorno = self._montar_cabecalho_ipv4(
+                    src_addr,
                     len(segmento_retorno),
                     IPPROTO_ICMP,
                     64
                 )
+                datagrama_retorno += segmento_retorno
                 return_hop = self._next_hop(src_addr)
-                self.enlace.enviar(cabecalho_ipv4 + segmento_retorno, return_hop)
+                self.enlace.enviar(datagrama_retorno, return_hop)
+
+    def _enviar_icmp_fragmentacao(self, datagrama, tam_cabecalho, src_addr, mtu):
+        """
+        Avisa a origem de que o datagrama, com DF, não cabe no MTU do próximo
+        enlace, que vai na mensagem (RFC 1191)
+        """
+        mensagem = bytearray(struct.pack('!BBHHH', 3, 4, 0, 0, mtu))
+        mensagem += datagrama[:(tam_cabecalho + 8)]
+        struct.pack_into('!H', mensagem, 2, calc_checksum(mensagem))
+        datagrama_retorno = self._montar_cabecalho_ipv4(
+            src_addr,
+            len(mensagem),
+            IPPROTO_ICMP,
+            64
+        )
+        datagrama_retorno += mensagem
+        self.enlace.enviar(datagrama_retorno, self._next_hop(src_addr))
 
     def _next_hop(self, dest_addr):
-        ip = self._ipaddr_para_bitstring(dest_addr)
-        return self._tabela_encaminhamento.find(ip)
+        """
+        Encontra o next_hop para dest_addr, que pode ser uma string (no
+        formato x.y.z.w) ou um inteiro de 32 bits. Ambas as formas são
+        guardadas no cache de rotas, então a conversão só é feita na falta.
+        """
+        next_hop = self.cache_rotas.obter(dest_addr)
+        if next_hop is CacheRotas.AUSENTE:
+            if isinstance(dest_addr, str):
+                next_hop = self._tabela_encaminhamento.buscar(_addr2int(dest_addr))
+            else:
+                next_hop = self._tabela_encaminhamento.buscar(dest_addr)
+            self.cache_rotas.inserir(dest_addr, next_hop)
+        return next_hop
 
     def definir_endereco_host(self, meu_endereco):
         """
@@ -63,6 +159,9 @@ class IP:
         atuaremos como roteador em vez de atuar como host.
         """
         self.meu_endereco = meu_endereco
+        self._meu_endereco_int = _addr2int(meu_endereco)
+        # Os modelos de cabeçalho guardam o endereço de origem antigo
+        self._modelos_cabecalho.clear()
 
     def definir_tabela_encaminhamento(self, tabela):
         """
@@ -72,12 +171,37 @@ class IP:
         Onde os CIDR são fornecidos no formato 'x.y.z.w/n', e os
         next_hop são fornecidos no formato 'x.y.z.w'.
         """
-        self._tabela_encaminhamento = TRIE()
-        for cidr, next_hop in tabela:
-            self._tabela_encaminhamento.insert(
-                self._cidr_para_bitstring(cidr),
-                next_hop
-            )
+        self._tabela_encaminhamento = TabelaEncaminhamento(tabela)
+        self.cache_rotas.limpar()
+
+    def adicionar_rota(self, cidr, next_hop):
+        """
+        Adiciona uma rota à tabela de encaminhamento (ou substitui a rota
+        existente para o mesmo CIDR), no mesmo formato usado em
+        definir_tabela_encaminhamento.
+        """
+        self._tabela_encaminhamento.adicionar(cidr, next_hop)
+        self.cache_rotas.limpar()
+
+    def remover_rota(self, cidr):
+        """
+        Remove a rota para o CIDR fornecido da tabela de encaminhamento.
+        Retorna False se não havia rota para esse CIDR.
+        """
+        removida = self._tabela_encaminhamento.remover(cidr)
+        if removida:
+            self.cache_rotas.limpar()
+        return removida
+
+    def definir_mtu(self, next_hop, mtu):
+        """
+        Define o MTU (em bytes) do enlace até next_hop (string no formato
+        x.y.z.w). Datagramas maiores enviados ou repassados por esse enlace
+        são fragmentados. Os demais usam MTU_PADRAO.
+        """
+        if mtu < MTU_MINIMO:
+            raise ValueError('o MTU deve ser de pelo menos %d bytes' % MTU_MINIMO)
+        self._mtus[next_hop] = mtu
 
     def registrar_recebedor(self, callback):
         """
@@ -92,47 +216,21 @@ class IP:
         """
         next_hop = self._next_hop(dest_addr)
 
-        # Montagem de cabeçalho
-        version__ihl = (4 << 4) + 5
-        dscp__ecn = 0
-        total_length = 20 + len(segmento)
-        identification = self.identification
-        flags__fragment_offset = 0
-        ttl = 64
-        protocol = IPPROTO_TCP
-        header_checksum = 0
-        src_addr = int.from_bytes(ip_address(self.meu_endereco).packed, 'big')
-        dest_addr = int.from_bytes(ip_address(dest_addr).packed, 'big')
-
-        cabecalho = self._montar_cabecalho_ipv4(
+        datagrama = self._montar_cabecalho_ipv4(
             dest_addr,
-            len(segmento), 
+            len(segmento),
             IPPROTO_TCP,
             64
         )
-
-        datagrama = cabecalho + segmento
-        self.enlace.enviar(datagrama, next_hop)
+        datagrama += segmento
+        mtu = self._mtus.get(next_hop, MTU_PADRAO)
+        if len(datagrama) <= mtu:
+            self.enlace.enviar(datagrama, next_hop)
+        else:
+            for fragmento in fragmentar(datagrama, 20, len(datagrama), mtu):
+                self.enlace.enviar(fragmento, next_hop)
         self.identification = (self.identification + 1) % (2**16)
 
-    def _cidr_para_bitstring(self, cidr: str):
-        ip, bits = cidr.split('/')
-        bits = int(bits)
-        ip = int.from_bytes(ip_address(ip).packed, 'big')
-        ip = f'{ip:032b}'[:bits]
-
-        return ip 
-    
-    def _ipaddr_para_bitstring(self, ipaddr: str):
-        ip = int.from_bytes(ip_address(ipaddr).packed, 'big')
-        return f'{ip:032b}'
-    
-    def _corrigir_checksum_ipv4(self, cabecalho: bytes):
-        header_checksum = calc_checksum(cabecalho)
-        cabecalho = bytearray(cabecalho)
-        cabecalho[10:12] = struct.pack('!H', header_checksum)
-        return bytes(cabecalho)
-    
     def _corrigir_checksum_icmp(self, cabecalho: bytes):
         header_checksum = calc_checksum(cabecalho)
         cabecalho = bytearray(cabecalho)
@@ -140,30 +238,56 @@ class IP:
         return bytes(cabecalho)
     
     def _montar_cabecalho_ipv4(self, dest_addr, tam_payload, protocol, ttl=64):
-        version__ihl = (4 << 4) + 5
-        dscp__ecn = 0
+        """
+        Monta um cabeçalho IPv4 (como bytearray) a partir do modelo em cache
+        para (dest_addr, protocol, ttl), preenchendo apenas o comprimento total
+        e a identificação e terminando o checksum a partir da soma parcial.
+        """
+        chave = (dest_addr, protocol, ttl)
+        modelo = self._modelos_cabecalho.get(chave)
+        if modelo is None:
+            modelo = self._criar_modelo_cabecalho_ipv4(dest_addr, protocol, ttl)
+            if len(self._modelos_cabecalho) >= TAM_CACHE_MODELOS:
+                self._modelos_cabecalho.clear()
+            self._modelos_cabecalho[chave] = modelo
+        cabecalho, soma_parcial = modelo
+
         total_length = 20 + tam_payload
         identification = self.identification
+        cabecalho = bytearray(cabecalho)
+        struct.pack_into('!HH', cabecalho, 2, total_length, identification)
+        soma = dobrar(soma_parcial + total_length + identification)
+        struct.pack_into('!H', cabecalho, 10, ~soma & 0xffff)
+        return cabecalho
+
+    def _criar_modelo_cabecalho_ipv4(self, dest_addr, protocol, ttl):
+        """
+        Cria o modelo de cabeçalho com os campos que não mudam entre datagramas
+        (comprimento total, identificação e checksum ficam zerados) e a soma
+        parcial desses campos para o checksum.
+        """
+        version__ihl = (4 << 4) + 5
+        dscp__ecn = 0
         flags__fragment_offset = 0
-        header_checksum = 0
-        src_addr = int.from_bytes(ip_address(self.meu_endereco).packed, 'big')
-        dest_addr = int.from_bytes(ip_address(dest_addr).packed, 'big')
+        src_addr = _addr2int(self.meu_endereco)
+        if isinstance(dest_addr, str):
+            dest_addr = _addr2int(dest_addr)
 
         cabecalho = struct.pack(
             '!BBHHHBBHII',
             version__ihl,
             dscp__ecn,
-            total_length,
-            identification,
+            0, # Total length
+            0, # Identification
             flags__fragment_offset,
             ttl,
             protocol,
-            header_checksum,
+            0, # Checksum
             src_addr,
             dest_addr
         )
-        return self._corrigir_checksum_ipv4(cabecalho)
-    
+        return cabecalho, somar(cabecalho)
+
     def _montar_cabecalho_icmp(self, type, code, rest):
         cabecalho = struct.pack(
             '!BBHI',
@@ -175,43 +299,337 @@ class IP:
         return self._corrigir_checksum_icmp(cabecalho)
 
 
-# Implementação de TRIE para a tabela de encaminhamento
-class TRIE:
-    _content: str | None
-    _one_child: TRIE
-    _zero_child: TRIE
-
-    def __init__(self, content: str | None = None) -> None:
-        self._content = content
-        self._one_child = None
-        self._zero_child = None
-
-    def find(self, key: str):
-        found = self._content
-        found_child = None
-
-        if len(key) > 0:
-            if key[0] == '0' and self._zero_child is not None:
-                found_child = self._zero_child.find(key[1:])
-            elif key[0] == '1' and self._one_child is not None:
-                found_child = self._one_child.find(key[1:])
-
-        if found_child is not None:
-            return found_child
-        return found
-
-    def insert(self, key: str, content: str):
-        if len(key) == 0:
-            self._content = content
-            return
-        
-        if key[0] == '0':
-            if self._zero_child is None:
-                self._zero_child = TRIE()
-
-            self._zero_child.insert(key[1:], content)
-        elif key[0] == '1':
-            if self._one_child is None:
-                self._one_child = TRIE()
-
-            self._one_child.insert(key[1:], content)
\ No newline at end of file
+# Tabela de encaminhamento com busca pelo prefixo mais longo (LPM)
+class TabelaEncaminhamento:
+    """
+    Mantém um dicionário {prefixo: next_hop} para cada comprimento de prefixo
+    presente na tabela. A busca trabalha sobre endereços inteiros de 32 bits e
+    testa os comprimentos do mais longo para o mais curto, sem recursão e sem
+    manipular strings.
+    """
+    _prefixos: dict[int, dict[int, str]]
+    _busca: list[tuple[int, dict[int, str]]]
+
+    def __init__(self, rotas=()) -> None:
+        self._prefixos = {}
+        self._busca = []
+        for cidr, next_hop in rotas:
+            self.adicionar(cidr, next_hop)
+
+    def __len__(self) -> int:
+        return sum(len(prefixos) for prefixos in self._prefixos.values())
+
+    def adicionar(self, cidr: str, next_hop: str):
+        """
+        Adiciona (ou substitui) a rota para cidr, no formato 'x.y.z.w/n'
+        """
+        prefixo, comprimento = _cidr_para_int(cidr)
+        if comprimento not in self._prefixos:
+            self._prefixos[comprimento] = {}
+            self._reconstruir_busca()
+        self._prefixos[comprimento][prefixo] = next_hop
+
+    def remover(self, cidr: str) -> bool:
+        """
+        Remove a rota para cidr. Retorna False se ela não existia.
+        """
+        prefixo, comprimento = _cidr_para_int(cidr)
+        prefixos = self._prefixos.get(comprimento)
+        if prefixos is None or prefixos.pop(prefixo, None) is None:
+            return False
+        if len(prefixos) == 0:
+            del self._prefixos[comprimento]
+            self._reconstruir_busca()
+        return True
+
+    def buscar(self, endereco: int) -> str | None:
+        """
+        Retorna o next_hop do prefixo mais longo que contém endereco (um
+        inteiro de 32 bits), ou None se nenhuma rota o contém.
+        """
+        for mascara, prefixos in self._busca:
+            next_hop = prefixos.get(endereco & mascara)
+            if next_hop is not None:
+                return next_hop
+        return None
+
+    def _reconstruir_busca(self):
+        self._busca = [
+            (_mascara(comprimento), self._prefixos[comprimento])
+            for comprimento in sorted(self._prefixos, reverse=True)
+        ]
+
+
+# Cache dos next_hop dos destinos usados mais recentemente
+class CacheRotas:
+    """
+    Cache LRU limitado de destino -> next_hop, consultado antes da busca na
+    tabela de encaminhamento. Precisa ser limpo sempre que a tabela mudar.
+    Os contadores acertos, falhas e remocoes ficam expostos como atributos.
+    """
+    AUSENTE = object()
+
+    def __init__(self, capacidade: int) -> None:
+        self.capacidade = capacidade
+        self._entradas = OrderedDict()
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def obter(self, destino):
+        """
+        Retorna o next_hop em cache para destino, ou CacheRotas.AUSENTE
+        """
+        try:
+            next_hop = self._entradas[destino]
+        except KeyError:
+            self.falhas += 1
+            return CacheRotas.AUSENTE
+        self._entradas.move_to_end(destino)
+        self.acertos += 1
+        return next_hop
+
+    def inserir(self, destino, next_hop):
+        self._entradas[destino] = next_hop
+        if len(self._entradas) > self.capacidade:
+            self._entradas.popitem(last=False)
+            self.remocoes += 1
+
+    def limpar(self):
+        self._entradas.clear()
+
+
+# Fragmentos guardados até que o datagrama original esteja completo
+class CacheRemontagem:
+    """
+    Remonta datagramas fragmentados, chaveados por (origem, destino,
+    identificação, protocolo). Cada datagrama guarda a lista dos buracos que
+    ainda faltam (RFC 815) e só os bytes que os preenchem, de modo que dados
+    repetidos por fragmentos sobrepostos não ocupam memória de novo.
+
+    Os datagramas incompletos são descartados, do mais antigo para o mais
+    novo, depois de tempo segundos ou quando os fragmentos guardados passam
+    de limite bytes. Cada datagrama incompleto conta
+    CUSTO_DATAGRAMA_INCOMPLETO bytes além dos seus dados. Os contadores
+    remontados, expirados e descartados ficam expostos como atributos.
+    """
+    def __init__(self, limite: int, tempo: float, relogio=time.monotonic) -> None:
+        self.limite = limite
+        self.tempo = tempo
+        self.relogio = relogio
+        # Em ordem de chegada do primeiro fragmento
+        self._datagramas = OrderedDict()
+        self.bytes_armazenados = 0
+        self.remontados = 0
+        self.expirados = 0
+        self.descartados = 0
+
+    def __len__(self) -> int:
+        return len(self._datagramas)
+
+    def adicionar(self, chave, offset: int, mais_fragmentos, dados):
+        """
+        Guarda um fragmento com offset em bytes. Retorna o payload do
+        datagrama original se ele ficou completo, ou None.
+        """
+        agora = self.relogio()
+        self._expirar(agora)
+        fim = offset + len(dados)
+        if fim > TAM_MAX_PAYLOAD or len(dados) == 0 or (mais_fragmentos and len(dados) % 8):
+            # Fragmentos vazios não acrescentam nada, e só o último fragmento
+            # pode ter um tamanho que não seja múltiplo de 8
+            self.descartados += 1
+            return None
+
+        datagrama = self._datagramas.get(chave)
+        if datagrama is None:
+            datagrama = self._datagramas[chave] = DatagramaIncompleto(agora)
+            self.bytes_armazenados += CUSTO_DATAGRAMA_INCOMPLETO
+        antes = datagrama.bytes_armazenados
+        if not datagrama.inserir(offset, fim, mais_fragmentos, dados):
+            # Fragmentos contraditórios sobre o fim do datagrama
+            self._remover(chave)
+            self.descartados += 1
+            return None
+        self.bytes_armazenados += datagrama.bytes_armazenados - antes
+
+        if datagrama.completo():
+            self._remover(chave)
+            self.remontados += 1
+            return datagrama.montar()
+        while self.bytes_armazenados > self.limite:
+            self._remover(next(iter(self._datagramas)))
+            self.descartados += 1
+        return None
+
+    def _expirar(self, agora):
+        while self._datagramas:
+            chave, datagrama = next(iter(self._datagramas.items()))
+            if agora - datagrama.criado_em < self.tempo:
+                break
+            self._remover(chave)
+            self.expirados += 1
+
+    def _remover(self, chave):
+        datagrama = self._datagramas.pop(chave)
+        self.bytes_armazenados -= CUSTO_DATAGRAMA_INCOMPLETO + datagrama.bytes_armazenados
+
+
+class DatagramaIncompleto:
+    """
+    Trechos já recebidos de um datagrama fragmentado e buracos [inicio, fim)
+    que ainda faltam. Enquanto o último fragmento não chega, o último buraco
+    vai até TAM_MAX_PAYLOAD.
+    """
+    __slots__ = ('criado_em', 'buracos', 'trechos', 'total', 'maior_fim',
+                 'bytes_armazenados')
+
+    def __init__(self, criado_em):
+        self.criado_em = criado_em
+        self.buracos = [(0, TAM_MAX_PAYLOAD)]
+        self.trechos = []
+        self.total = None
+        self.maior_fim = 0
+        self.bytes_armazenados = 0
+
+    def inserir(self, offset, fim, mais_fragmentos, dados):
+        """
+        Preenche com dados (que começam em offset) os buracos que eles
+        cobrem. Retorna False se o fragmento contradiz o tamanho total.
+        """
+        if not mais_fragmentos:
+            if (self.total is not None and self.total != fim) or self.maior_fim > fim:
+                return False
+            self.total = fim
+            self.buracos = [(inicio, min(final, fim)) for inicio, final in self.buracos
+                            if inicio < fim]
+        elif self.total is not None and fim > self.total:
+            return False
+        self.maior_fim = max(self.maior_fim, fim)
+
+        buracos = []
+        for inicio, final in self.buracos:
+            if final <= offset or inicio >= fim:
+                buracos.append((inicio, final))
+                continue
+            a, b = max(inicio, offset), min(final, fim)
+            self.trechos.append((a, bytes(dados[a-offset:b-offset])))
+            self.bytes_armazenados += b - a
+            if inicio < a:
+                buracos.append((inicio, a))
+            if b < final:
+                buracos.append((b, final))
+        self.buracos = buracos
+        return True
+
+    def completo(self):
+        return not self.buracos
+
+    def montar(self):
+        self.trechos.sort()
+        return b''.join(trecho for _, trecho in self.trechos)
+
+
+def fragmentar(datagrama, tam_cabecalho, total_len, mtu):
+    """
+    Divide um datagrama em fragmentos de até mtu bytes, cada um com uma cópia
+    do cabeçalho. O primeiro fragmento leva todas as opções, e os demais só
+    as que têm o bit OPCAO_COPIADA (RFC 791). Se o datagrama já for um
+    fragmento, os novos fragmentos mantêm o offset e, no último, a flag MF
+    do original.
+    """
+    flagsfrag, = struct.unpack_from('!H', datagrama, 6)
+    offset = 8 * (flagsfrag & MASCARA_OFFSET)
+    ultimo_mf = flagsfrag & FLAG_MF
+    cabecalho = datagrama[:tam_cabecalho]
+    if tam_cabecalho > 20:
+        cabecalho_seguintes = bytearray(cabecalho[:20])
+        cabecalho_seguintes += _opcoes_copiadas(cabecalho[20:])
+        cabecalho_seguintes[0] = 0x40 | len(cabecalho_seguintes) // 4
+    else:
+        cabecalho_seguintes = cabecalho
+    fragmentos = []
+    inicio = tam_cabecalho
+    while inicio < total_len:
+        cab = cabecalho if inicio == tam_cabecalho else cabecalho_seguintes
+        fim = min(inicio + (mtu - len(cab)) // 8 * 8, total_len)
+        fragmento = bytearray(cab)
+        fragmento += datagrama[inicio:fim]
+        mf = ultimo_mf if fim == total_len else FLAG_MF
+        struct.pack_into('!H', fragmento, 2, len(fragmento))
+        struct.pack_into('!H', fragmento, 6, mf | (offset + inicio - tam_cabecalho) // 8)
+        struct.pack_into('!H', fragmento, 10, 0)
+        struct.pack_into('!H', fragmento, 10, calc_checksum(memoryview(fragmento)[:len(cab)]))
+        fragmentos.append(fragmento)
+        inicio = fim
+    return fragmentos
+
+
+def _opcoes_copiadas(opcoes):
+    """
+    Opções IPv4 com o bit OPCAO_COPIADA, completadas com zeros até um
+    múltiplo de 4 bytes
+    """
+    copiadas = bytearray()
+    i = 0
+    while i < len(opcoes):
+        tipo = opcoes[i]
+        if tipo == 0:
+            # Fim da lista de opções
+            break
+        if tipo == 1:
+            # NOP, sem campo de tamanho
+            i += 1
+            continue
+        if i + 1 >= len(opcoes) or opcoes[i+1] < 2:
+            break
+        tamanho = opcoes[i+1]
+        if tipo & OPCAO_COPIADA:
+            copiadas += opcoes[i:i+tamanho]
+        i += tamanho
+    copiadas += bytes(-len(copiadas) % 4)
+    return copiadas
+
+
+def ler_cabecalho_ipv4(datagrama):
+    """
+    Lê os campos do cabeçalho IPv4 usados no caminho de recepção com um único
+    unpack_from, sem criar strings nem copiar o payload. Retorna
+    (tam_cabecalho, total_len, identification, flagsfrag, ttl, proto,
+    src_addr, dst_addr), com os endereços como inteiros de 32 bits.
+    """
+    vihl, total_len, identification, flagsfrag, ttl, proto, \
+        src_addr, dst_addr = struct.unpack_from('!BxHHHBBxxII', datagrama)
+    assert vihl >> 4 == 4
+    return 4*(vihl & 0xf), total_len, identification, flagsfrag, ttl, proto, \
+        src_addr, dst_addr
+
+
+def _mascara(comprimento: int) -> int:
+    return (0xffffffff << (32 - comprimento)) & 0xffffffff
+
+
+def _addr2int(addr: str) -> int:
+    return struct.unpack('!I', str2addr(addr))[0]
+
+
+# Endereços já formatados como string, para não repetir a formatação a cada
+# datagrama recebido
+_enderecos_formatados: dict[int, str] = {}
+
+def _int2addr(addr: int) -> str:
+    texto = _enderecos_formatados.get(addr)
+    if texto is None:
+        if len(_enderecos_formatados) >= TAM_CACHE_ENDERECOS:
+            _enderecos_formatados.clear()
+        texto = _enderecos_formatados[addr] = addr2str(struct.pack('!I', addr))
+    return texto
+
+
+def _cidr_para_int(cidr: str) -> tuple[int, int]:
+    ip, bits = cidr.split('/')
+    bits = int(bits)
+    return _addr2int(ip) & _mascara(bits), bits
@@ -12,7 +12,7 @@ from slip import CamadaEnlace
 def sair(conexao: Conexao):
     tratar_saida(conexao)
 
-    ip_cliente, porta_cliente = conexao.s.getpeername()
+    ip_cliente, porta_cliente = conexao.id_conexao[:2]
     print(f'Conexão fechada com {ip_cliente}:{porta_cliente}')
 
     conexao.fechar()
@@ -21,25 +21,29 @@ def dados_recebidos(conexao: Conexao, dados: bytes):
     if dados == b'':
         return sair(conexao)
     
-    ip_cliente, porta_cliente = conexao.s.getpeername()
-    conexao._residuo = conexao._residuo + dados
+    ip_cliente, porta_cliente = conexao.id_conexao[:2]
+    conexao.dados_aplicacao.residuo = conexao.dados_aplicacao.residuo + dados
 
-    mensagem, separador, restante = conexao._residuo.partition(b'\r\n')
-    while separador != b'':
-        print(f'Mensagem recebida de {ip_cliente}:{porta_cliente}: {mensagem}')
+    # Junta as respostas a todas as mensagens recebidas em poucos segmentos
+    conexao.cork()
+    try:
+        mensagem, separador, restante = conexao.dados_aplicacao.residuo.partition(b'\r\n')
+        while separador != b'':
+            print(f'Mensagem recebida de {ip_cliente}:{porta_cliente}: {mensagem}')
 
-        interpretar_mensagem(conexao, mensagem)
+            interpretar_mensagem(conexao, mensagem)
 
-        conexao._residuo = restante
-        mensagem, separador, restante = conexao._residuo.partition(b'\r\n')
+            conexao.dados_aplicacao.residuo = restante
+            mensagem, separador, restante = conexao.dados_aplicacao.residuo.partition(b'\r\n')
+    finally:
+        # Mesmo se uma mensagem der erro, a conexão não pode ficar tampada
+        conexao.flush()
 
 def conexao_aceita(conexao: Conexao):
-    ip_cliente, porta_cliente = conexao.s.getpeername()
+    ip_cliente, porta_cliente = conexao.id_conexao[:2]
     print(f'Nova conexão de {ip_cliente}:{porta_cliente}')
 
-    conexao._residuo = b''
-    conexao._apelido = b'*'
-    conexao._canais = set()
+    conexao.dados_aplicacao = SessaoIRC()
     conexao.registrar_recebedor(dados_recebidos)
 
 def main():
@@ -83,7 +87,7 @@ def interpretar_mensagem(conexao: Conexao, msg: bytes):
             tratar_privmsg_canal(conexao, campos[1], b' '.join(campos[2:]))
         else:
             tratar_privmsg_pessoal(conexao, campos[1], b' '.join(campos[2:]))
-    elif verbo == b'JOIN' and conexao._apelido != b'*':
+    elif verbo == b'JOIN' and conexao.dados_aplicacao.apelido != b'*':
         tratar_join(conexao, campos[1])
     elif verbo == b'PART':
         tratar_part(conexao, campos[1])
@@ -94,35 +98,35 @@ def tratar_ping(conexao: Conexao, payload: bytes):
 
 def tratar_nick(conexao: Conexao, apelido: bytes):
     if not validar_nome(apelido):
-        conexao.enviar(b':server 432 %s %s :Erroneous nickname\r\n' % (conexao._apelido, apelido))
+        conexao.enviar(b':server 432 %s %s :Erroneous nickname\r\n' % (conexao.dados_aplicacao.apelido, apelido))
         return
     
     estado = EstadoIRC.obter()
-    disponivel = estado.tentar_apelido_novo(conexao._apelido, apelido, conexao)
+    disponivel = estado.tentar_apelido_novo(conexao.dados_aplicacao.apelido, apelido, conexao)
     EstadoIRC.liberar()
 
     if disponivel:
-        if conexao._apelido == b'*':
+        if conexao.dados_aplicacao.apelido == b'*':
             conexao.enviar(b':server 001 %s :Welcome\r\n' % apelido)
             conexao.enviar(b':server 422 %s :MOTD File is missing\r\n' % apelido)
         else:
-            conexao.enviar(b':%s NICK %s\r\n' % (conexao._apelido, apelido))
+            conexao.enviar(b':%s NICK %s\r\n' % (conexao.dados_aplicacao.apelido, apelido))
 
-        conexao._apelido = apelido 
+        conexao.dados_aplicacao.apelido = apelido 
     else:
-        conexao.enviar(b':server 433 %s %s :Nickname is already in use\r\n' % (conexao._apelido, apelido))
+        conexao.enviar(b':server 433 %s %s :Nickname is already in use\r\n' % (conexao.dados_aplicacao.apelido, apelido))
 
 def tratar_privmsg_pessoal(conexao: Conexao, destinatario: bytes, conteudo: bytes):
-    if conexao._apelido != b'*' and len(conteudo) >= 2 and conteudo[0:1] == b':':
+    if conexao.dados_aplicacao.apelido != b'*' and len(conteudo) >= 2 and conteudo[0:1] == b':':
         estado = EstadoIRC.obter()
         conexao_destinatario = estado.procurar_destinatario(destinatario)
         EstadoIRC.liberar()
 
         if conexao_destinatario is not None:
-            conexao_destinatario.enviar(b':%s PRIVMSG %s %s\r\n' % (conexao._apelido, conexao_destinatario._apelido, conteudo))
+            conexao_destinatario.enviar(b':%s PRIVMSG %s %s\r\n' % (conexao.dados_aplicacao.apelido, conexao_destinatario.dados_aplicacao.apelido, conteudo))
 
 def tratar_privmsg_canal(conexao: Conexao, canal: bytes, conteudo: bytes):
-    if conexao._apelido != b'*' and len(conteudo) >= 2 and conteudo[0:1] == b':':
+    if conexao.dados_aplicacao.apelido != b'*' and len(conteudo) >= 2 and conteudo[0:1] == b':':
         estado = EstadoIRC.obter()
         conexoes_canal = estado.procurar_canal(canal)
         EstadoIRC.liberar()
@@ -132,7 +136,7 @@ def tratar_privmsg_canal(conexao: Conexao, canal: bytes, conteudo: bytes):
             for membro in conexoes_canal:
                 if membro is not conexao:
                     mensagem = asyncio.create_task(
-                        enviar_assincrono(membro, b':%s PRIVMSG %s %s\r\n' % (conexao._apelido, canal.lower(), conteudo))
+                        enviar_assincrono(membro, b':%s PRIVMSG %s %s\r\n' % (conexao.dados_aplicacao.apelido, canal.lower(), conteudo))
                     )
                     mensagens.add(mensagem)
                     mensagem.add_done_callback(mensagens.discard)
@@ -142,50 +146,50 @@ def tratar_join(conexao: Conexao, canal: bytes):
         estado = EstadoIRC.obter()
         membros = estado.adicionar_membro_ao_canal(conexao, canal)
         EstadoIRC.liberar()
-        conexao._canais.add(canal.lower())
+        conexao.dados_aplicacao.canais.add(canal.lower())
 
         mensagens = set()
         for membro in membros:
             if membro is not conexao:
                 mensagem = asyncio.create_task(
-                    enviar_assincrono(membro, b':%s JOIN :%s\r\n' % (conexao._apelido, canal.lower()))
+                    enviar_assincrono(membro, b':%s JOIN :%s\r\n' % (conexao.dados_aplicacao.apelido, canal.lower()))
                 )
                 mensagens.add(mensagem)
                 mensagem.add_done_callback(mensagens.discard)
-        conexao.enviar(b':%s JOIN :%s\r\n' % (conexao._apelido, canal.lower()))
+        conexao.enviar(b':%s JOIN :%s\r\n' % (conexao.dados_aplicacao.apelido, canal.lower()))
 
-        nomes_membros = sorted(list(map((lambda c: c._apelido.lower()), membros)))
-        msg_buffer = b':server 353 %s = %s :' % (conexao._apelido, canal.lower())
+        nomes_membros = sorted(list(map((lambda c: c.dados_aplicacao.apelido.lower()), membros)))
+        msg_buffer = b':server 353 %s = %s :' % (conexao.dados_aplicacao.apelido, canal.lower())
         for nome in nomes_membros:
             if len(msg_buffer + nome) < 510:
                 msg_buffer = msg_buffer + nome + b' '
             else:
                 msg_buffer = msg_buffer[:-1] + b'\r\n'
                 conexao.enviar(msg_buffer)
-                msg_buffer = b':server 353 %s = %s :%s ' % (conexao._apelido, canal.lower(), nome)
+                msg_buffer = b':server 353 %s = %s :%s ' % (conexao.dados_aplicacao.apelido, canal.lower(), nome)
         msg_buffer = msg_buffer[:-1] + b'\r\n'
         conexao.enviar(msg_buffer)
-        conexao.enviar(b':server 366 %s %s :End of /NAMES list.\r\n' % (conexao._apelido, canal.lower()))
+        conexao.enviar(b':server 366 %s %s :End of /NAMES list.\r\n' % (conexao.dados_aplicacao.apelido, canal.lower()))
     else:
         conexao.enviar(b':server 403 %s :No such channel\r\n' % canal)
 
 def tratar_part(conexao: Conexao, canal: bytes):
     canal = canal.lower()
-    if canal in conexao._canais:
+    if canal in conexao.dados_aplicacao.canais:
         estado = EstadoIRC.obter()
         membros = estado.remover_membro_de_canal(conexao, canal)
         EstadoIRC.liberar()
-        conexao._canais.remove(canal)
+        conexao.dados_aplicacao.canais.remove(canal)
 
         mensagens = set()
         for membro in membros:
             mensagem = asyncio.create_task(
-                enviar_assincrono(membro, b':%s PART %s\r\n' % (conexao._apelido, canal.lower()))
+                enviar_assincrono(membro, b':%s PART %s\r\n' % (conexao.dados_aplicacao.apelido, canal.lower()))
             )
             mensagens.add(mensagem)
             mensagem.add_done_callback(mensagens.discard)
 
-        conexao.enviar(b':%s PART %s\r\n' % (conexao._apelido, canal.lower()))
+        conexao.enviar(b':%s PART %s\r\n' % (conexao.dados_aplicacao.apelido, canal.lower()))
 
 def tratar_saida(conexao: Conexao):
     estado = EstadoIRC.obter()
@@ -195,7 +199,7 @@ def tratar_saida(conexao: Conexao):
     mensagens = set()
     for colega in colegas:
         mensagem = asyncio.create_task(
-            enviar_assincrono(colega, b':%s QUIT :Connection closed\r\n' % conexao._apelido)
+            enviar_assincrono(colega, b':%s QUIT :Connection closed\r\n' % conexao.dados_aplicacao.apelido)
         )
         mensagens.add(mensagem)
         mensagem.add_done_callback(mensagens.discard)
@@ -205,6 +209,15 @@ async def enviar_assincrono(conexao: Conexao, dados: bytes):
 
 # -----------------------
 
+# Estado de cada cliente, guardado em Conexao.dados_aplicacao
+class SessaoIRC:
+    __slots__ = ('residuo', 'apelido', 'canais')
+
+    def __init__(self):
+        self.residuo = b''
+        self.apelido = b'*'
+        self.canais: set[bytes] = set()
+
 # Singleton de dados do servidor
 class EstadoIRC:
     _instancia = None
@@ -263,9 +276,11 @@ class EstadoIRC:
     
     def remover_de_todos_canais(self, conexao: Conexao) -> set[Conexao]:
         colegas = set()
-        for canal in conexao._canais:
+        for canal in conexao.dados_aplicacao.canais:
             colegas.update(self.remover_membro_de_canal(conexao, canal))
 
-        self._conexoes.pop(conexao._apelido)
+        # Os apelidos são guardados em minúsculas, e quem sai sem ter
+        # escolhido um apelido (b'*') não está no dicionário
+        self._conexoes.pop(conexao.dados_aplicacao.apelido.lower(), None)
 
         return colegas
\ No newline at end of file
@@ -1,7 +1,12 @@
+import re
+
+# Tamanho máximo padrão de um quadro já desescapado, em bytes
+TAM_MAX_QUADRO = 1500
+
 class CamadaEnlace:
     ignore_checksum = False
 
-    def __init__(self, linhas_seriais):
+    def __init__(self, linhas_seriais, tam_max_quadro=TAM_MAX_QUADRO):
         """
         Inicia uma camada de enlace com um ou mais enlaces, cada um conectado
         a uma linha serial distinta. O argumento linhas_seriais é um dicionário
@@ -9,13 +14,14 @@ class CamadaEnlace:
         host ou roteador que se encontra na outra ponta do enlace, escrito como
         uma string no formato 'x.y.z.w'. A linha_serial é um objeto da classe
         PTY (vide camadafisica.py) ou de outra classe que implemente os métodos
-        registrar_recebedor e enviar.
+        registrar_recebedor e enviar. Quadros recebidos maiores que
+        tam_max_quadro bytes são descartados.
         """
         self.enlaces = {}
         self.callback = None
         # Constrói um Enlace para cada linha serial
         for ip_outra_ponta, linha_serial in linhas_seriais.items():
-            enlace = Enlace(linha_serial)
+            enlace = Enlace(linha_serial, tam_max_quadro)
             self.enlaces[ip_outra_ponta] = enlace
             enlace.registrar_recebedor(self._callback)
 
@@ -38,66 +44,124 @@ class CamadaEnlace:
         if self.callback:
             self.callback(datagrama)
 
-ESTADO_OCIOSO = 0
-ESTADO_LENDO = 1
-ESTADO_ESCAPE = 2
+SLIP_END = 0xC0
+SLIP_ESC = 0xDB
+# Bytes que precisam ser escapados e as sequências que os substituem
+_ESPECIAIS = re.compile(rb'[\xC0\xDB]')
+_ESCAPES = {
+    SLIP_END: b'\xDB\xDC',
+    SLIP_ESC: b'\xDB\xDD',
+}
+_DESESCAPES = {
+    0xDC: b'\xC0',
+    0xDD: b'\xDB',
+}
+
+def codificar_quadro(datagrama, saida=None):
+    """
+    Codifica um datagrama em um quadro SLIP, escapando os bytes 0xC0 e 0xDB
+    em uma única passada. O datagrama pode ser bytes, bytearray ou memoryview
+    e não é copiado antes da codificação. Se saida (um bytearray) for fornecida,
+    o quadro é escrito ao final dela, o que permite reaproveitar o mesmo buffer
+    entre chamadas; caso contrário, um novo bytearray é criado.
+    """
+    if saida is None:
+        saida = bytearray()
+    dados = memoryview(datagrama)
+    if dados.format != 'B':
+        dados = dados.cast('B')
+
+    saida.append(SLIP_END)
+    inicio = 0
+    for especial in _ESPECIAIS.finditer(dados):
+        i = especial.start()
+        saida += dados[inicio:i]
+        saida += _ESCAPES[dados[i]]
+        inicio = i + 1
+    saida += dados[inicio:]
+    saida.append(SLIP_END)
+    return saida
 
 class Enlace:
-    def __init__(self, linha_serial):
+    def __init__(self, linha_serial, tam_max_quadro=TAM_MAX_QUADRO):
         self.linha_serial = linha_serial
         self.linha_serial.registrar_recebedor(self.__raw_recv)
-        self.buffer = b''
-        self.estado = ESTADO_OCIOSO
+        self.tam_max_quadro = tam_max_quadro
+        # Buffer pré-alocado onde o quadro em construção é montado
+        self.buffer = bytearray(tam_max_quadro)
+        self._tam = 0
+        self._escape = False
+        self._descartando = False
+        self.quadros_descartados = 0
 
     def registrar_recebedor(self, callback):
         self.callback = callback
 
     def enviar(self, datagrama):
-        quadro = b''
-        for byte in bytearray(datagrama):
-            byte = byte.to_bytes(1, 'big', signed=False)
-            
-            if byte == b'\xC0':
-                quadro = quadro + b'\xDB\xDC'
-            elif byte == b'\xDB':
-                quadro = quadro + b'\xDB\xDD'
+        # O quadro é entregue à linha serial, que pode mantê-lo em uma fila,
+        # então não reaproveitamos o buffer de saída aqui
+        self.linha_serial.enviar(codificar_quadro(datagrama))
+
+    def __raw_recv(self, dados):
+        dados = memoryview(dados)
+        if dados.format != 'B':
+            dados = dados.cast('B')
+        pos = 0
+        fim = len(dados)
+
+        if self._escape and fim > 0:
+            # O byte de escape chegou no final do pedaço anterior
+            self._escape = False
+            self._acrescentar(_DESESCAPES.get(dados[0], b''))
+            pos = 1
+
+        while pos < fim:
+            especial = _ESPECIAIS.search(dados, pos)
+            if especial is None:
+                self._acrescentar(dados[pos:])
+                break
+
+            i = especial.start()
+            if i > pos:
+                self._acrescentar(dados[pos:i])
+
+            if dados[i] == SLIP_END:
+                self._finalizar_quadro()
+                pos = i + 1
+            elif i + 1 < fim:
+                self._acrescentar(_DESESCAPES.get(dados[i + 1], b''))
+                pos = i + 2
             else:
-                quadro = quadro + byte
+                self._escape = True
+                pos = fim
 
-        quadro = b'\xC0' + quadro + b'\xC0'
-        self.linha_serial.enviar(quadro)
+    def _acrescentar(self, trecho):
+        """
+        Copia um trecho já desescapado para o buffer do quadro em construção
+        """
+        if self._descartando:
+            return
+        novo_tam = self._tam + len(trecho)
+        if novo_tam > self.tam_max_quadro:
+            # Quadro grande demais, ignora tudo até o próximo 0xC0
+            self._descartando = True
+            return
+        self.buffer[self._tam:novo_tam] = trecho
+        self._tam = novo_tam
 
-    def __raw_recv(self, dados):
-        for byte in dados:
-            byte = byte.to_bytes(1, 'big', signed=False)
-            if self.estado == ESTADO_OCIOSO:
-                if byte == b'\xDB':
-                    self.estado = ESTADO_ESCAPE
-                elif byte == b'\xC0':
-                    self.estado = ESTADO_LENDO
-                else:
-                    self.buffer = self.buffer + byte
-                    self.estado = ESTADO_LENDO
-            elif self.estado == ESTADO_LENDO:
-                if byte == b'\xC0':
-                    if len(self.buffer) > 0: # Ignorando quadros vazios
-                        try:
-                            self.callback(self.buffer)
-                        except:
-                            # ignora a exceção, mas mostra na tela
-                            import traceback
-                            traceback.print_exc()
-
-                    self.buffer = b''
-                    self.estado = ESTADO_OCIOSO
-                elif byte == b'\xDB':
-                    self.estado = ESTADO_ESCAPE
-                else:
-                    self.buffer = self.buffer + byte
-            elif self.estado == ESTADO_ESCAPE:
-                if byte == b'\xDC':
-                    self.buffer = self.buffer + b'\xC0'
-                elif byte == b'\xDD':
-                    self.buffer = self.buffer + b'\xDB'
-
-                self.estado = ESTADO_LENDO
+    def _finalizar_quadro(self):
+        if self._descartando:
+            self.quadros_descartados += 1
+        elif self._tam > 0: # Ignorando quadros vazios
+            # Cada quadro é entregue em um bytearray próprio, que a camada
+            # de rede pode alterar no lugar ao encaminhar o datagrama
+            quadro = self.buffer[:self._tam]
+            try:
+                self.callback(quadro)
+            except:
+                # ignora a exceção, mas mostra na tela
+                import traceback
+                traceback.print_exc()
+
+        self._tam = 0
+        self._descartando = False
@@ -1,15 +1,157 @@
-import asyncio
+import hashlib
+import os
+import struct
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
 from random import randint
-from time import time
 from tcputils import *
+from checksum import calc_checksum, fix_checksum
+from congestionamento import NewReno
+from temporizador import RodaTemporizadores
+
+# Tipos de opção do cabeçalho TCP (RFC 9293 e RFC 2018)
+OPCAO_FIM = 0
+OPCAO_NOP = 1
+OPCAO_ESCALA_JANELA = 3
+OPCAO_SACK_PERMITIDO = 4
+OPCAO_SACK = 5
+# Os 40 bytes de opções comportam no máximo 4 blocos SACK
+MAX_BLOCOS_SACK = 4
+# Maior deslocamento permitido na escala de janela (RFC 7323)
+ESCALA_MAXIMA = 14
+# Conexões semiabertas (SYN recebido, esperando o ACK final) guardadas por
+# Servidor. Com a fila cheia, os SYNs seguintes são respondidos com SYN cookies.
+BACKLOG_SYN = 64
+# Timeout inicial (s) e número máximo de retransmissões do SYN+ACK de uma
+# conexão semiaberta
+TIMEOUT_SYNACK = 3
+MAX_RETRANSMISSOES_SYNACK = 5
+# Período (s) do contador de tempo dos SYN cookies. Um cookie é aceito até o
+# fim do período seguinte ao de sua emissão.
+PERIODO_COOKIE = 64
+# Bits do cookie: 5 do contador de tempo, 1 do SACK permitido, 4 da escala de
+# janela do cliente e 21 de MAC. O bit mais alto fica zerado, como nos
+# números de sequência iniciais escolhidos pelo Servidor.
+BITS_MAC_COOKIE = 21
+
+# Portas, números de sequência, flags e janela, lidos de uma só vez
+_CABECALHO = struct.Struct('!HHIIHH')
+
+# Demultiplexador de cada camada de rede, sem prolongar a vida da rede
+_demultiplexadores = weakref.WeakKeyDictionary()
+
+
+class Demultiplexador:
+    """
+    Camada entre a rede e os Servidores de um mesmo host. Cada segmento é
+    entregue diretamente à conexão estabelecida a que pertence, procurada
+    pelo par de endereços e portas em uma única tabela, ou então ao Servidor
+    que escuta na porta de destino. Há um Demultiplexador por camada de rede,
+    criado pelo primeiro Servidor que a usa.
+    """
+    @classmethod
+    def da_rede(cls, rede):
+        """
+        Retorna o Demultiplexador da rede, criando-o na primeira vez
+        """
+        demultiplexador = _demultiplexadores.get(rede)
+        if demultiplexador is None:
+            demultiplexador = _demultiplexadores[rede] = cls(rede)
+        return demultiplexador
+
+    def __init__(self, rede):
+        # A rede guarda o Demultiplexador (pelo recebedor registrado), então
+        # uma referência forte de volta impediria que a entrada em
+        # _demultiplexadores fosse liberada junto com a rede
+        self.rede = weakref.proxy(rede)
+        self.servidores = {}    # porta -> Servidor
+        self.conexoes = {}      # (src_addr, src_port, dst_addr, dst_port) -> Conexao
+        rede.registrar_recebedor(self._rdt_rcv)
+
+    def registrar_servidor(self, servidor):
+        if servidor.porta in self.servidores:
+            raise ValueError('a porta %d já está em uso' % servidor.porta)
+        self.servidores[servidor.porta] = servidor
+
+    def remover_servidor(self, servidor):
+        if self.servidores.get(servidor.porta) is servidor:
+            del self.servidores[servidor.porta]
+
+    def registrar_conexao(self, conexao):
+        self.conexoes[conexao.id_conexao] = conexao
+
+    def remover_conexao(self, id_conexao):
+        self.conexoes.pop(id_conexao, None)
+
+    def _rdt_rcv(self, src_addr, dst_addr, segment):
+        src_port, dst_port, seq_no, ack_no, flags, window_size = \
+            _CABECALHO.unpack_from(segment)
+        conexao = self.conexoes.get((src_addr, src_port, dst_addr, dst_port))
+        if conexao is None or (flags & FLAGS_SYN) == FLAGS_SYN:
+            # Abertura de conexão ou segmento desconhecido: o Servidor decide
+            servidor = self.servidores.get(dst_port)
+            if servidor is not None:
+                servidor._rdt_rcv(src_addr, dst_addr, segment)
+            return
+
+        if not self.rede.ignore_checksum and calc_checksum(segment, src_addr, dst_addr) != 0:
+            print('descartando segmento com checksum incorreto')
+            return
+        tamanho = 4*(flags>>12)
+        conexao._rdt_rcv(seq_no, ack_no, flags, segment[tamanho:],
+                         segment[20:tamanho], window_size)
+
+
+class ConexaoSemiAberta:
+    """
+    O mínimo que o Servidor guarda de um SYN enquanto espera o ACK final
+    """
+    __slots__ = ('iss', 'irs', 'sack_permitido', 'escala_envio', 'retransmissoes',
+                 'retransmitir_em')
+
+    def __init__(self, iss, irs, sack_permitido, escala_envio, agora):
+        self.iss = iss
+        self.irs = irs
+        self.sack_permitido = sack_permitido
+        self.escala_envio = escala_envio
+        self.retransmissoes = 0
+        self.retransmitir_em = agora + TIMEOUT_SYNACK
+
 
 class Servidor:
-    def __init__(self, rede, porta):
+    def __init__(self, rede, porta, controle_congestionamento=NewReno,
+                 backlog=BACKLOG_SYN, ociosidade_maxima=None):
+        """
+        controle_congestionamento é a classe (ou outra função sem argumentos)
+        que cria o algoritmo de controle de congestionamento de cada conexão
+        aceita, por exemplo congestionamento.Reno ou congestionamento.Cubic.
+
+        backlog é o número máximo de conexões semiabertas guardadas. Com a
+        fila cheia, o Servidor responde aos SYNs com SYN cookies, sem guardar
+        nada, e a conexão só é criada se o ACK final trouxer um cookie válido.
+
+        ociosidade_maxima é o tempo (s) sem receber nada do outro lado depois
+        do qual uma conexão estabelecida é abortada, ou None para nunca abortar.
+        """
         self.rede = rede
         self.porta = porta
+        self.controle_congestionamento = controle_congestionamento
         self.conexoes = {}
         self.callback = None
-        self.rede.registrar_recebedor(self._rdt_rcv)
+        self.backlog = backlog
+        self.semiabertas = {}
+        self.cookies_enviados = 0
+        self._segredo = os.urandom(16)
+        self.ociosidade_maxima = ociosidade_maxima
+        # Temporizadores de todas as conexões (retransmissão, ACK atrasado e
+        # sondagem de janela) ficam em uma única roda
+        self.temporizadores = RodaTemporizadores()
+        # Um único temporizador retransmite os SYN+ACKs de toda a fila
+        self.timer_semiabertas = self.temporizadores.criar(self._retransmitir_synacks)
+        # Vários Servidores, em portas diferentes, podem usar a mesma rede
+        self.demultiplexador = Demultiplexador.da_rede(rede)
+        self.demultiplexador.registrar_servidor(self)
 
     def registrar_monitor_de_conexoes_aceitas(self, callback):
         """
@@ -30,208 +172,1055 @@ class Servidor:
             return
 
         payload = segment[4*(flags>>12):]
+        opcoes = segment[20:4*(flags>>12)]
         id_conexao = (src_addr, src_port, dst_addr, dst_port)
 
         if (flags & FLAGS_SYN) == FLAGS_SYN:
             # A flag SYN estar setada significa que é um cliente tentando estabelecer uma conexão nova
-            conexao = self.conexoes[id_conexao] = Conexao(self, id_conexao, seq_no, window_size)
-
-            if self.callback:
-                self.callback(conexao)
+            if id_conexao not in self.conexoes:
+                self._syn_recebido(id_conexao, seq_no, opcoes)
         elif id_conexao in self.conexoes:
             # Passa para a conexão adequada se ela já estiver estabelecida
-            self.conexoes[id_conexao]._rdt_rcv(seq_no, ack_no, flags, payload)
-        else:
+            self.conexoes[id_conexao]._rdt_rcv(seq_no, ack_no, flags, payload, opcoes,
+                                               window_size)
+        elif (flags & FLAGS_RST) == FLAGS_RST:
+            # O cliente desistiu da abertura
+            semiaberta = self.semiabertas.get(id_conexao)
+            if semiaberta is not None and seq_no == semiaberta.irs + 1:
+                del self.semiabertas[id_conexao]
+        elif (flags & FLAGS_ACK) != FLAGS_ACK or \
+                not self._completar_handshake(id_conexao, seq_no, ack_no, flags,
+                                              payload, opcoes, window_size):
             print('%s:%d -> %s:%d (pacote associado a conexão desconhecida)' %
                   (src_addr, src_port, dst_addr, dst_port))
+
+    def _agora(self):
+        return self.temporizadores.loop.time()
+
+    def _syn_recebido(self, id_conexao, seq_no, opcoes):
+        """
+        Responde a um SYN com SYN+ACK, guardando a conexão semiaberta se
+        houver espaço na fila ou usando um SYN cookie se não houver
+        """
+        semiaberta = self.semiabertas.get(id_conexao)
+        if semiaberta is not None:
+            # SYN retransmitido: reenvia o mesmo SYN+ACK. Um SYN com outro
+            # número de sequência não substitui o que já está na fila.
+            if semiaberta.irs == seq_no:
+                self._enviar_synack(id_conexao, semiaberta.iss, semiaberta.irs,
+                                    semiaberta.sack_permitido, semiaberta.escala_envio)
+            return
+
+        sack_permitido, escala_envio = ler_opcoes_syn(opcoes)
+        if len(self.semiabertas) < self.backlog:
+            iss = randint(0, 0xffff)
+            self.semiabertas[id_conexao] = ConexaoSemiAberta(
+                iss, seq_no, sack_permitido, escala_envio, self._agora())
+            if not self.timer_semiabertas.armado:
+                self.timer_semiabertas.armar(TIMEOUT_SYNACK)
+        else:
+            iss = self._cookie(id_conexao, seq_no, sack_permitido, escala_envio,
+                               int(self._agora() // PERIODO_COOKIE))
+            self.cookies_enviados += 1
+        self._enviar_synack(id_conexao, iss, seq_no, sack_permitido, escala_envio)
+
+    def _completar_handshake(self, id_conexao, seq_no, ack_no, flags, payload,
+                             opcoes, window_size):
+        """
+        Cria a conexão quando chega o ACK final do handshake, de uma conexão
+        semiaberta da fila ou com um SYN cookie válido. Retorna False se o
+        ACK não corresponde a nenhum dos dois.
+        """
+        semiaberta = self.semiabertas.get(id_conexao)
+        if semiaberta is not None and ack_no == semiaberta.iss + 1 and \
+                seq_no == semiaberta.irs + 1:
+            del self.semiabertas[id_conexao]
+            iss, irs = semiaberta.iss, semiaberta.irs
+            sack_permitido, escala_envio = semiaberta.sack_permitido, semiaberta.escala_envio
+        else:
+            iss, irs = ack_no - 1, seq_no - 1
+            opcoes_cookie = self._validar_cookie(id_conexao, irs, iss)
+            if opcoes_cookie is None:
+                return False
+            sack_permitido, escala_envio = opcoes_cookie
+
+        conexao = self.conexoes[id_conexao] = Conexao(
+            self, id_conexao, iss, irs, window_size, sack_permitido, escala_envio)
+        self.demultiplexador.registrar_conexao(conexao)
+        if self.callback:
+            self.callback(conexao)
+        # O ACK final pode trazer dados
+        conexao._rdt_rcv(seq_no, ack_no, flags, payload, opcoes, window_size)
+        return True
+
+    def _enviar_synack(self, id_conexao, iss, irs, sack_permitido, escala_envio):
+        opcoes = b''
+        if sack_permitido:
+            opcoes += OPCOES_SACK_PERMITIDO
+        if escala_envio is not None:
+            opcoes += opcao_escala_janela(escala_para(TAM_BUFFER_RECEPCAO))
+        # A janela do SYN+ACK nunca é escalada
+        segment = montar_cabecalho(id_conexao[3], id_conexao[1], iss, irs + 1,
+                                   FLAGS_SYN | FLAGS_ACK, opcoes,
+                                   min(TAM_BUFFER_RECEPCAO, 0xffff))
+        segment = fix_checksum(segment, id_conexao[2], id_conexao[0])
+        self.rede.enviar(segment, id_conexao[0])
+
+    def _retransmitir_synacks(self):
+        """
+        Reenvia os SYN+ACKs vencidos da fila de conexões semiabertas, com
+        backoff exponencial, e descarta as que esgotaram as retransmissões
+        """
+        agora = self._agora()
+        proximo = None
+        for id_conexao, semiaberta in list(self.semiabertas.items()):
+            if semiaberta.retransmitir_em <= agora:
+                if semiaberta.retransmissoes >= MAX_RETRANSMISSOES_SYNACK:
+                    del self.semiabertas[id_conexao]
+                    continue
+                semiaberta.retransmissoes += 1
+                semiaberta.retransmitir_em = agora + \
+                    TIMEOUT_SYNACK * 2**semiaberta.retransmissoes
+                self._enviar_synack(id_conexao, semiaberta.iss, semiaberta.irs,
+                                    semiaberta.sack_permitido, semiaberta.escala_envio)
+            if proximo is None or semiaberta.retransmitir_em < proximo:
+                proximo = semiaberta.retransmitir_em
+        if proximo is not None:
+            self.timer_semiabertas.armar(proximo - agora)
+
+    def _cookie(self, id_conexao, irs, sack_permitido, escala_envio, contador):
+        """
+        Número de sequência inicial que codifica as opções do SYN e um MAC
+        do par de endereços e portas, do número de sequência do cliente e do
+        contador de tempo, de modo que o ACK final possa ser validado sem
+        nenhum estado guardado
+        """
+        info = ((contador & 0x1f) << 5) | (int(sack_permitido) << 4) | \
+            (0xf if escala_envio is None else escala_envio)
+        return (info << BITS_MAC_COOKIE) | self._mac_cookie(id_conexao, irs, contador, info)
+
+    def _mac_cookie(self, id_conexao, irs, contador, info):
+        mensagem = ('%s:%d %s:%d %d %d %d' % (id_conexao + (irs, contador, info))).encode()
+        mac = hashlib.blake2s(mensagem, key=self._segredo, digest_size=4).digest()
+        return int.from_bytes(mac, 'big') & ((1 << BITS_MAC_COOKIE) - 1)
+
+    def _validar_cookie(self, id_conexao, irs, cookie):
+        """
+        Retorna (sack_permitido, escala_envio) se cookie foi emitido por este
+        Servidor no período atual ou no anterior, ou None se não foi
+        """
+        if not 0 <= cookie < 1 << (BITS_MAC_COOKIE + 10):
+            return None
+        info = cookie >> BITS_MAC_COOKIE
+        mac = cookie & ((1 << BITS_MAC_COOKIE) - 1)
+        atual = int(self._agora() // PERIODO_COOKIE)
+        for contador in (atual, atual - 1):
+            if contador & 0x1f == info >> 5 and \
+                    self._mac_cookie(id_conexao, irs, contador, info) == mac:
+                escala = info & 0xf
+                return bool(info & 0x10), (None if escala == 0xf else escala)
+        return None
             
+    def bytes_fora_de_ordem(self):
+        """
+        Total de bytes recebidos fora de ordem e guardados pelas conexões
+        """
+        return sum(conexao.fila_reordenacao.bytes_armazenados
+                   for conexao in self.conexoes.values())
+
     def remover_conexao(self, id_conexao):
         self.conexoes.pop(id_conexao, None)
+        self.demultiplexador.remover_conexao(id_conexao)
+
+    def definir_ociosidade_maxima(self, segundos):
+        """
+        Aborta as conexões que passarem segundos sem receber nada do outro
+        lado, ou nunca, se segundos for None
+        """
+        self.ociosidade_maxima = segundos
+        for conexao in self.conexoes.values():
+            conexao._armar_encerramento()
+
+    def fechar(self):
+        """
+        Deixa de aceitar conexões na porta, liberando-a para outro Servidor.
+        As conexões já estabelecidas continuam funcionando.
+        """
+        self.demultiplexador.remover_servidor(self)
+        self.semiabertas.clear()
+        self.timer_semiabertas.desarmar()
+
+def montar_cabecalho(src_port, dst_port, seq_no, ack_no, flags, opcoes=b'',
+                     janela=8*MSS):
+    """
+    Como tcputils.make_header, mas com a janela anunciada dada e seguido das
+    opções, cujo tamanho deve ser múltiplo de 4
+    """
+    return struct.pack('!HHIIHHHH',
+                       src_port, dst_port, seq_no, ack_no,
+                       ((5 + len(opcoes)//4) << 12) | flags,
+                       janela, 0, 0) + opcoes
+
+
+def ler_opcoes(opcoes):
+    """
+    Retorna uma lista de pares (tipo, valor) com as opções de um cabeçalho
+    TCP, ignorando NOPs e parando em uma opção malformada
+    """
+    lidas = []
+    i = 0
+    while i < len(opcoes):
+        tipo = opcoes[i]
+        if tipo == OPCAO_FIM:
+            break
+        if tipo == OPCAO_NOP:
+            i += 1
+            continue
+        if i + 1 >= len(opcoes) or opcoes[i+1] < 2:
+            break
+        tamanho = opcoes[i+1]
+        lidas.append((tipo, bytes(opcoes[i+2:i+tamanho])))
+        i += tamanho
+    return lidas
+
+
+def opcao_sack(blocos):
+    """
+    Codifica blocos SACK (inicio, fim), precedidos de dois NOPs para alinhar
+    """
+    return struct.pack('!BBBB', OPCAO_NOP, OPCAO_NOP, OPCAO_SACK, 2 + 8*len(blocos)) + \
+        b''.join(struct.pack('!II', inicio, fim) for inicio, fim in blocos)
+
+
+def opcao_escala_janela(escala):
+    """
+    Codifica a opção de escala de janela, precedida de um NOP para alinhar
+    """
+    return struct.pack('!BBBB', OPCAO_NOP, OPCAO_ESCALA_JANELA, 3, escala)
+
+
+def escala_para(tamanho):
+    """
+    Menor escala de janela com que tamanho cabe nos 16 bits do cabeçalho
+    """
+    escala = 0
+    while tamanho >> escala > 0xffff and escala < ESCALA_MAXIMA:
+        escala += 1
+    return escala
+
+
+def ler_opcoes_syn(opcoes):
+    """
+    Retorna (sack_permitido, escala_envio) das opções de um SYN. escala_envio
+    é None se o cliente não anunciou a escala de janela (RFC 7323).
+    """
+    opcoes = dict(ler_opcoes(opcoes))
+    escala = opcoes.get(OPCAO_ESCALA_JANELA)
+    if escala is not None and len(escala) == 1:
+        escala = min(escala[0], ESCALA_MAXIMA)
+    else:
+        escala = None
+    return OPCAO_SACK_PERMITIDO in opcoes, escala
+
+
+# Opção enviada no SYN e no SYN+ACK para anunciar suporte a SACK
+OPCOES_SACK_PERMITIDO = struct.pack('!BBBB', OPCAO_NOP, OPCAO_NOP,
+                                    OPCAO_SACK_PERMITIDO, 2)
 
 ALPHA = 0.125
 BETA = 0.25
+BACKOFF_MAXIMO = 64
+# Limites do timeout de retransmissão (s). O mínimo é o do Linux, mais baixo
+# que o 1 s da RFC 6298, e vale antes do backoff, para que amostras de RTT
+# quase nulas (loopback, LAN) não façam o timer disparar a cada tique.
+RTO_MINIMO = 0.2
+RTO_MAXIMO = 60
+# Quantidade máxima de bytes recebidos fora de ordem guardados por conexão
+TAM_MAX_REORDENACAO = 64 * 1024
+# Tempo máximo que um ACK pode ser atrasado à espera de outro segmento ou de
+# dados da aplicação em que possa ir junto (RFC 1122, seção 4.2.3.2)
+ATRASO_ACK = 0.2
+# Espaço do buffer de recepção da aplicação, que define a janela anunciada
+TAM_BUFFER_RECEPCAO = 256 * 1024
+# Limites do intervalo entre sondagens de janela zero (s)
+INTERVALO_MINIMO_SONDAGEM = 0.2
+INTERVALO_MAXIMO_SONDAGEM = 60
+# Tempo máximo de vida de um segmento na rede (s). Quem fecha a conexão
+# primeiro fica 2*MSL em TIME_WAIT, para reconhecer um FIN repetido.
+MSL = 30
+TEMPO_TIME_WAIT = 2 * MSL
+# Tempo (s) sem receber nada do outro lado depois do qual uma conexão que
+# está sendo fechada é descartada, caso ele tenha sumido
+TEMPO_FECHAMENTO = 60
+
+# Estados de uma Conexao (RFC 9293, seção 3.3.2). Os estados da abertura não
+# aparecem, já que o Servidor só cria a Conexao ao fim do handshake.
+ESTABELECIDA = 'ESTABELECIDA'
+FIN_WAIT_1 = 'FIN_WAIT_1'
+FIN_WAIT_2 = 'FIN_WAIT_2'
+CLOSING = 'CLOSING'
+TIME_WAIT = 'TIME_WAIT'
+CLOSE_WAIT = 'CLOSE_WAIT'
+LAST_ACK = 'LAST_ACK'
+FECHADA = 'FECHADA'
+# Estados em que a aplicação ainda pode escrever: depois de fechar(), o FIN
+# marca o fim dos dados
+ESTADOS_ESCRITA = (ESTABELECIDA, CLOSE_WAIT)
+
+
 class Conexao:
-    def __init__(self, servidor, id_conexao, seq_no, window_size):
+    # Sem __dict__, o tamanho de cada conexão é fixo. A aplicação guarda o
+    # que precisar em dados_aplicacao.
+    __slots__ = (
+        'servidor', 'id_conexao', 'callback', 'callback_envio', 'callback_encerramento',
+        'dados_aplicacao', 'estado',
+        'timer', 'timer_persistencia', 'timer_ack', 'timer_encerramento',
+        'fila_retransmissao', 'fila_reordenacao', 'buffer_envio',
+        'estimated_rtt', 'dev_rtt', 'controle', 'backoff',
+        'acks_duplicados', 'em_recuperacao', 'recuperar_ate',
+        'retransmissoes_rapidas', 'retransmissoes_por_timeout',
+        'sack_permitido', 'tam_buffer_recepcao', 'escala_envio', 'escala_recepcao',
+        'janela_receptor', 'maior_janela_receptor', 'backoff_persistencia',
+        'leitura_pausada', '_nao_lidos', 'bytes_nao_lidos', '_fin_nao_lido',
+        'janela_anunciada', 'current_seq_no', 'last_acked_no', 'expected_seq_no',
+        'maior_seq_enviado', 'prestes_a_fechar', 'fin_enviado',
+        'ack_imediato', 'segmentos_sem_ack', 'ack_enviado',
+        'nagle', 'tampado', 'empurrar_ate', 'ultima_atividade',
+    )
+
+    def __init__(self, servidor, id_conexao, iss, irs, window_size,
+                 sack_permitido=False, escala_envio=None):
+        """
+        Conexão já estabelecida: o Servidor só a cria ao receber o ACK final
+        do handshake. iss e irs são os números de sequência iniciais do
+        Servidor e do cliente, e window_size é a janela do ACK final.
+        """
         self.servidor = servidor
         self.id_conexao = id_conexao
         self.callback = None
-        self.timer = None
-        self.unacked_segments = []
-        self.fila_de_envio = []
+        self.callback_envio = None
+        self.callback_encerramento = None
+        self.dados_aplicacao = None
+        self.estado = ESTABELECIDA
+        self.timer = servidor.temporizadores.criar(self._resend_timer)
+        self.fila_retransmissao = FilaRetransmissao()
         self.estimated_rtt = None
         self.dev_rtt = None
-        self.current_window_size = 1 # * MSS
-        self.current_seq_no = randint(0, 0xffff)
+        self.controle = servidor.controle_congestionamento()
+        # Recuperação rápida (NewReno)
+        self.acks_duplicados = 0
+        self.em_recuperacao = False
+        self.recuperar_ate = None
+        self.retransmissoes_rapidas = 0
+        self.retransmissoes_por_timeout = 0
+        # Multiplicador do timeout, dobrado a cada timeout seguido (RFC 6298)
+        self.backoff = 1
+        # SACK (RFC 2018) só é usado se o cliente o anunciou no SYN
+        self.sack_permitido = sack_permitido
+        # Controle de fluxo. A escala de janela (RFC 7323) só é usada se o
+        # cliente a anunciou no SYN.
+        self.tam_buffer_recepcao = TAM_BUFFER_RECEPCAO
+        self.escala_envio = escala_envio
+        if escala_envio is not None:
+            self.escala_recepcao = escala_para(self.tam_buffer_recepcao)
+        else:
+            self.escala_recepcao = 0
+        self.janela_receptor = window_size << (escala_envio or 0)
+        self.maior_janela_receptor = self.janela_receptor
+        self.timer_persistencia = servidor.temporizadores.criar(self._sondar_janela)
+        self.backoff_persistencia = 1
+        # Dados entregues em ordem, guardados enquanto a leitura está pausada
+        self.leitura_pausada = False
+        self._nao_lidos = []
+        self.bytes_nao_lidos = 0
+        self._fin_nao_lido = False
+        # Janela anunciada no SYN+ACK, que nunca é escalada
+        self.janela_anunciada = min(self.tam_buffer_recepcao, 0xffff)
+        # O SYN de cada lado ocupa um número de sequência
+        self.current_seq_no = iss + 1
         self.last_acked_no = self.current_seq_no
-        self.expected_seq_no = seq_no + 1
+        self.expected_seq_no = irs + 1
         self.prestes_a_fechar = False
-        self.handshake_completo = False
-
-        # Responde com SYNACK para a abertura de conexão
-        self._enviar_segmento(
-            FLAGS_SYN | FLAGS_ACK,
-            b'',
-        )
+        self.fin_enviado = False
+        # Maior número de sequência já enviado, para identificar retransmissões
+        # depois de voltar atrás em um timeout
+        self.maior_seq_enviado = self.current_seq_no
+        # Segmentos recebidos fora de ordem
+        self.fila_reordenacao = FilaReordenacao(TAM_MAX_REORDENACAO)
+        # ACK atrasado: reconhece a cada dois segmentos ou após ATRASO_ACK
+        self.ack_imediato = False
+        self.timer_ack = servidor.temporizadores.criar(self._ack_atrasado)
+        self.segmentos_sem_ack = 0
+        self.ack_enviado = self.expected_seq_no
+        # Agrupamento de escritas pequenas (algoritmo de Nagle, RFC 896)
+        self.nagle = True
+        self.tampado = False
+        # Dados até este número de sequência podem sair em um segmento menor
+        # que o MSS mesmo com Nagle ou cork (flush e fechar)
+        self.empurrar_ate = 0
+        # Os dados da aplicação começam logo após o número de sequência do SYN
+        self.buffer_envio = BufferEnvio(self.current_seq_no)
+        # Fechamento (TIME_WAIT e conexões que estão sendo fechadas) e limite
+        # de ociosidade. Receber um segmento só atualiza ultima_atividade, e
+        # o temporizador é adiado quando dispara antes da hora.
+        self.ultima_atividade = self._agora()
+        self.timer_encerramento = servidor.temporizadores.criar(self._expirar)
+        self._armar_encerramento()
 
     def _timeout_interval(self):
         """
-        Calcula o timeout com base no RTT estimado
+        Calcula o timeout com base no RTT estimado, entre RTO_MINIMO e
+        RTO_MAXIMO (RFC 6298, seções 2.4 e 2.5)
         """
         if self.estimated_rtt is None:
-            return 3
+            rto = 3
         else:
-            return self.estimated_rtt + 4 * self.dev_rtt
-        
+            rto = max(self.estimated_rtt + 4 * self.dev_rtt, RTO_MINIMO)
+        return min(rto * self.backoff, RTO_MAXIMO)
+
+    def _agora(self):
+        return self.servidor.temporizadores.loop.time()
+
     def _estimar_rtt(self, sample_rtt):
         """
         Nova estimativa para o RTT
         """
-        if not self.handshake_completo:
-            # Não use o ACK de abertura de conexão para estimar
-            self.handshake_completo = True
-            return
-
         if self.estimated_rtt is None:
             self.estimated_rtt = sample_rtt
             self.dev_rtt = sample_rtt / 2
         else:
             self.estimated_rtt = (1-ALPHA) * self.estimated_rtt + ALPHA * sample_rtt
             self.dev_rtt = (1-BETA) * self.dev_rtt + BETA * abs(sample_rtt - self.estimated_rtt)
+        self.controle.ao_medir_rtt(sample_rtt)
 
-    def _rdt_rcv(self, seq_no, ack_no, flags, payload):
-        # Fechamento de conexão
-        if (flags & FLAGS_FIN) == FLAGS_FIN:
-            self.expected_seq_no += 1
-            self._enviar_segmento(
-                FLAGS_ACK,
-                b''
-            )
-            self.callback(self, b'')
+    def _rdt_rcv(self, seq_no, ack_no, flags, payload, opcoes=b'', window_size=None):
+        self.ultima_atividade = self._agora()
+        if (flags & FLAGS_RST) == FLAGS_RST:
+            # Só aceita o RST dentro da janela, para que um segmento antigo
+            # ou forjado não derrube a conexão (RFC 9293, seção 3.10.7.4)
+            if self.expected_seq_no <= seq_no <= \
+                    self.expected_seq_no + self.janela_anunciada:
+                self._abortar(enviar_rst=False)
             return
 
         # Um ACK
         if (flags & FLAGS_ACK) == FLAGS_ACK:
+            if self.sack_permitido and len(opcoes) > 0:
+                self._registrar_sacks(ack_no, opcoes)
+            janela_alterada = window_size is not None and ack_no >= self.last_acked_no \
+                and self._atualizar_janela_receptor(window_size)
+
             # Um novo pacote foi ACKED!
             if ack_no > self.last_acked_no:
-                if self.timer is not None:
-                    self.timer.cancel()
-                    self.timer = None
+                self.timer.desarmar()
 
+                bytes_reconhecidos = ack_no - self.last_acked_no
                 self.last_acked_no = ack_no
-                # Ajusta o tamanho da janela com o novo ACK
-                if self.handshake_completo:
-                    self.current_window_size += 1
-
-                # Verifica se algum dos pacotes enviados
-                # ainda não foi reconhecido
-                smallest_unacked_segment_idx = None
-                for i, (unacked_seq_no, _, _, _) in enumerate(self.unacked_segments):
-                    if unacked_seq_no > self.last_acked_no - 1:
-                        smallest_unacked_segment_idx = i
-                        break
-
-                # Todos os pacotes enviados já foram reconhecidos
-                if smallest_unacked_segment_idx is None:
-                    if not self.unacked_segments[-1][3]:
+                if ack_no > self.current_seq_no:
+                    # Depois de um timeout voltamos atrás, mas o outro lado
+                    # já tinha recebido além desse ponto
+                    self.current_seq_no = ack_no
+                    if self.prestes_a_fechar and ack_no > self.buffer_envio.fim:
+                        self.fin_enviado = True
+                self.acks_duplicados = 0
+                self.backoff = 1
+                self.buffer_envio.liberar(ack_no)
+
+                # Retira da fila os segmentos inteiramente reconhecidos
+                amostra = self.fila_retransmissao.reconhecer(ack_no)
+                if amostra is not None:
+                    enviado_em, retransmitido = amostra
+                    if not retransmitido:
                         # Um pacote não-retransmitido foi reconhecido,
                         # então deve-se estimar o novo RTT
-                        self._estimar_rtt(time() - self.unacked_segments[-1][2])
+                        self._estimar_rtt(self._agora() - enviado_em)
 
-                    self.unacked_segments = []
-                # Ainda há pacotes sem um ACK
+                # Ajusta o tamanho da janela com o novo ACK
+                if self.em_recuperacao:
+                    if ack_no >= self.recuperar_ate:
+                        # Tudo que estava em voo na perda foi reconhecido
+                        self.em_recuperacao = False
+                        self.controle.ao_sair_da_recuperacao()
+                    elif not (self.controle.recuperacao_newreno or self.sack_permitido):
+                        # Reno sai da recuperação no primeiro ACK novo, e uma
+                        # nova perda na mesma janela recomeça o processo
+                        self.em_recuperacao = False
+                        self.recuperar_ate = None
+                        self.controle.ao_sair_da_recuperacao()
+                    elif self.sack_permitido:
+                        # ACK parcial com SACK: reenvia os buracos que couberem
+                        # na janela. Se o outro lado não informou nenhum trecho
+                        # além do ACK, o próximo segmento é o buraco.
+                        if self.fila_retransmissao.maior_sack <= ack_no:
+                            self.retransmissoes_rapidas += 1
+                            self._retransmitir_primeiro()
+                        self._retransmitir_buracos()
+                    else:
+                        # ACK parcial: o próximo segmento também se perdeu
+                        self.controle.ao_ack_parcial(bytes_reconhecidos)
+                        self.retransmissoes_rapidas += 1
+                        self._retransmitir_primeiro()
                 else:
-                    if i > 0 and not self.unacked_segments[i-1][3]:
-                        # Um pacote não-retransmitido foi reconhecido,
-                        # então deve-se estimar o novo RTT
-                        self._estimar_rtt(time() - self.unacked_segments[i-1][2])
+                    self.controle.ao_receber_ack(bytes_reconhecidos, self._agora())
 
-                    self.unacked_segments = self.unacked_segments[i:]
-                    self.timer = asyncio.get_event_loop().call_later(self._timeout_interval(), self._resend_timer)
+                # Ainda há pacotes sem um ACK
+                if len(self.fila_retransmissao) > 0 and not self.timer.armado:
+                    self.timer.armar(self._timeout_interval())
 
                 # Com um ACK, podemos tentar enviar o que está na fila
                 self._enviar_fila()
+                if self.callback_envio is not None:
+                    self.callback_envio(self)
+            elif janela_alterada:
+                # Atualização de janela, não conta como ACK duplicado
+                self._enviar_fila()
+            elif ack_no == self.last_acked_no and len(payload) == 0 and \
+                    (flags & FLAGS_FIN) == 0 and len(self.fila_retransmissao) > 0:
+                self._ack_duplicado()
 
-            # ACK do fechamento
-            if self.prestes_a_fechar:
-                self.servidor.remover_conexao(self.id_conexao)
-                return
+            if self.fin_enviado and ack_no > self.buffer_envio.fim:
+                # O outro lado reconheceu o nosso FIN
+                self._fin_reconhecido()
+                if self.estado == FECHADA:
+                    return
 
-            # Não precisa responder com um ACK se foi só um ACK vazio
-            if len(payload) == 0:
-                return
+        if len(payload) > 0:
+            self._receber_dados(seq_no, payload)
+        if (flags & FLAGS_FIN) == FLAGS_FIN:
+            self._receber_fin(seq_no + len(payload))
+
+    def _receber_dados(self, seq_no, payload):
+        if seq_no < self.expected_seq_no < seq_no + len(payload):
+            # Retransmissão que cobre em parte dados já recebidos
+            payload = payload[self.expected_seq_no - seq_no:]
+            seq_no = self.expected_seq_no
 
         if seq_no == self.expected_seq_no:
-            self.expected_seq_no += len(payload)
-            if payload != b'':
-                self.callback(self, payload)
+            livre = self._janela_disponivel()
+            if len(payload) > livre:
+                # Não cabe no buffer de recepção (por exemplo, uma sondagem
+                # de janela zero): aceita só o que couber
+                payload = payload[:livre]
+                if livre == 0:
+                    self._enviar_ack()
+                    return
+            # O payload pode ser um memoryview sobre o datagrama recebido
+            dados = bytes(payload)
+            self.expected_seq_no += len(dados)
+            preencheu_buraco = len(self.fila_reordenacao) > 0
+            if preencheu_buraco:
+                # O buraco pode ter sido preenchido, então entrega junto os
+                # dados que já estavam esperando logo em seguida
+                seguintes = self.fila_reordenacao.retirar(self.expected_seq_no)
+                self.expected_seq_no += len(seguintes)
+                dados += seguintes
+            if dados != b'':
+                self._entregar(dados)
+            self._agendar_ack(preencheu_buraco)
+            return
+        elif seq_no > self.expected_seq_no and len(payload) > 0:
+            # Chegou adiantado, guarda até que o buraco seja preenchido
+            self.fila_reordenacao.inserir(seq_no, bytes(payload))
 
-        self._enviar_segmento(
-            FLAGS_ACK,
-            b'',
-        )
+        # Segmentos fora de ordem ou repetidos são reconhecidos imediatamente,
+        # para que o outro lado perceba a perda (RFC 5681, seção 4.2)
+        self._enviar_ack()
 
-    def _calcular_bytes_inflight(self):
-        if len(self.unacked_segments) == 0:
-            return 0
+    def _receber_fin(self, seq_fin):
+        """
+        Trata o FIN do outro lado, que ocupa o número de sequência seq_fin
+        """
+        if seq_fin != self.expected_seq_no or \
+                self.estado not in (ESTABELECIDA, FIN_WAIT_1, FIN_WAIT_2):
+            # FIN repetido, porque o nosso ACK se perdeu, ou fora de ordem
+            self._enviar_ack()
+            if self.estado == TIME_WAIT:
+                self._armar_encerramento()
+            return
+
+        self.expected_seq_no += 1
+        self._enviar_ack()
+        if self.estado == ESTABELECIDA:
+            self.estado = CLOSE_WAIT
+        elif self.estado == FIN_WAIT_1:
+            # Os dois lados fecharam ao mesmo tempo
+            self.estado = CLOSING
+        else:
+            self._entrar_time_wait()
+        self._armar_encerramento()
+        # Avisa a aplicação, depois dos dados que ela ainda não leu
+        if self.leitura_pausada:
+            self._fin_nao_lido = True
+        else:
+            self.callback(self, b'')
+
+    def _fin_reconhecido(self):
+        if self.estado == FIN_WAIT_1:
+            self.estado = FIN_WAIT_2
+            self._armar_encerramento()
+        elif self.estado == CLOSING:
+            self._entrar_time_wait()
+        elif self.estado == LAST_ACK:
+            self._encerrar()
+
+    def _entrar_time_wait(self):
+        self.estado = TIME_WAIT
+        self.timer.desarmar()
+        self.timer_persistencia.desarmar()
+        self._armar_encerramento()
+        # Para a aplicação, a conexão já terminou
+        if self.callback_encerramento is not None:
+            self.callback_encerramento(self)
+
+    def _limite_ociosidade(self):
+        if self.estado in (ESTABELECIDA, CLOSE_WAIT):
+            return self.servidor.ociosidade_maxima
+        return TEMPO_FECHAMENTO
+
+    def _armar_encerramento(self):
+        if self.estado == TIME_WAIT:
+            self.timer_encerramento.armar(TEMPO_TIME_WAIT)
+            return
+        limite = self._limite_ociosidade()
+        if limite is None:
+            self.timer_encerramento.desarmar()
         else:
-            return self.unacked_segments[-1][0] - self.last_acked_no + 1
-    
-    def _enviar_segmento(self, flags, payload):
+            self.timer_encerramento.armar(limite)
+
+    def _expirar(self):
+        if self.estado == TIME_WAIT:
+            self._encerrar()
+            return
+        limite = self._limite_ociosidade()
+        if limite is None:
+            return
+        ociosa = self._agora() - self.ultima_atividade
+        if ociosa < limite:
+            # Recebeu algo depois que o temporizador foi armado
+            self.timer_encerramento.armar(limite - ociosa)
+        else:
+            self._abortar()
+
+    def _abortar(self, enviar_rst=True):
         """
-        Adiciona um segmento à fila de envio
+        Descarta a conexão sem o fechamento normal. A aplicação é avisada
+        como em um fechamento se ainda não tinha fechado nem sido avisada.
         """
+        if enviar_rst:
+            self._enviar_dados(self.current_seq_no, FLAGS_RST | FLAGS_ACK, b'')
+        avisar = self.estado == ESTABELECIDA
+        self._encerrar()
+        if avisar and self.callback:
+            self.callback(self, b'')
 
-        # Separa os dados em pacotes de 1MSS
-        while len(payload) > MSS:
-            self.fila_de_envio.append((self.current_seq_no, flags, payload[:MSS]))
-            self.current_seq_no += MSS
-            payload = payload[MSS:]
+    def _encerrar(self):
+        """
+        Libera a conexão: nada mais a referencia a partir do Servidor
+        """
+        avisar = self.estado != TIME_WAIT and self.callback_encerramento is not None
+        self.estado = FECHADA
+        self.timer.desarmar()
+        self.timer_ack.desarmar()
+        self.timer_persistencia.desarmar()
+        self.timer_encerramento.desarmar()
+        self.servidor.remover_conexao(self.id_conexao)
+        if avisar:
+            self.callback_encerramento(self)
 
-        self.fila_de_envio.append((self.current_seq_no, flags, payload))
-        self.current_seq_no += len(payload)
-        if len(payload) == 0 and ((flags & FLAGS_SYN) == FLAGS_SYN or (flags & FLAGS_FIN) == FLAGS_FIN):
-            self.current_seq_no += 1
+    def _agendar_ack(self, imediato=False):
+        """
+        Reconhece dados recebidos em ordem. O ACK é enviado na hora a cada
+        dois segmentos, ou se imediato ou self.ack_imediato. Caso contrário,
+        espera até ATRASO_ACK para que possa ir junto com dados de resposta.
+        """
+        if self.ack_enviado == self.expected_seq_no:
+            # A aplicação respondeu e o ACK já foi junto com os dados
+            return
+        self.segmentos_sem_ack += 1
+        if imediato or self.ack_imediato or self.segmentos_sem_ack >= 2:
+            self._enviar_ack()
+        elif not self.timer_ack.armado:
+            self.timer_ack.armar(ATRASO_ACK)
+
+    def _ack_atrasado(self):
+        if self.ack_enviado != self.expected_seq_no:
+            self._enviar_ack()
+
+    def _ack_enviado(self):
+        """
+        Chamado a cada segmento enviado, já que todos levam o ACK atual
+        """
+        self.ack_enviado = self.expected_seq_no
+        self.segmentos_sem_ack = 0
+        self.timer_ack.desarmar()
+
+    def _entregar(self, dados):
+        if self.leitura_pausada:
+            self._nao_lidos.append(dados)
+            self.bytes_nao_lidos += len(dados)
+        else:
+            self.callback(self, dados)
+
+    def _janela_restante(self):
+        """
+        Quanto da última janela anunciada ainda resta além de expected_seq_no
+        """
+        if self.ack_enviado is None:
+            return 0
+        return max(0, self.ack_enviado + self.janela_anunciada - self.expected_seq_no)
+
+    def _janela_disponivel(self):
+        """
+        Quantos bytes além de expected_seq_no podem ser aceitos: o espaço
+        livre no buffer de recepção, sem recuar a borda direita da janela já
+        anunciada (RFC 9293, seção 3.8.6.2.2)
+        """
+        livre = self.tam_buffer_recepcao - self.bytes_nao_lidos
+        return max(livre, self._janela_restante())
+
+    def _janela_a_anunciar(self):
+        """
+        Janela a anunciar. Ela só cresce em passos de pelo menos um MSS ou
+        metade do buffer, para evitar a síndrome da janela boba (RFC 1122,
+        seção 4.2.3.3).
+        """
+        janela = self._janela_disponivel()
+        restante = self._janela_restante()
+        if janela - restante < min(MSS, self.tam_buffer_recepcao // 2):
+            return restante
+        return janela
+
+    def _janela_cabecalho(self, flags):
+        """
+        Valor do campo de janela do cabeçalho, já dividido pela escala
+        """
+        campo = min(self._janela_a_anunciar() >> self.escala_recepcao, 0xffff)
+        self.janela_anunciada = campo << self.escala_recepcao
+        return campo
+
+    def _atualizar_janela_receptor(self, window_size):
+        """
+        Registra a janela anunciada pelo outro lado. Retorna True se ela mudou.
+        """
+        janela = window_size << (self.escala_envio or 0)
+        if janela == self.janela_receptor:
+            return False
+        self.janela_receptor = janela
+        self.maior_janela_receptor = max(self.maior_janela_receptor, janela)
+        if janela > 0 and self.timer_persistencia.armado:
+            self.timer_persistencia.desarmar()
+            self.backoff_persistencia = 1
+        return True
+
+    def _registrar_sacks(self, ack_no, opcoes):
+        """
+        Marca no placar da fila de retransmissão os trechos que o outro lado
+        informou, com blocos SACK, já ter recebido
+        """
+        for tipo, valor in ler_opcoes(opcoes):
+            if tipo != OPCAO_SACK:
+                continue
+            for inicio, fim in struct.iter_unpack('!II', valor[:len(valor)//8*8]):
+                if fim > ack_no:
+                    self.fila_retransmissao.marcar_sack(inicio, fim)
+
+    def _ack_duplicado(self):
+        """
+        Trata um ACK duplicado. O terceiro seguido indica a perda do primeiro
+        segmento não reconhecido, que é retransmitido sem esperar o timeout,
+        e a conexão entra em recuperação rápida (NewReno, RFC 6582).
+        """
+        self.acks_duplicados += 1
+        if self.em_recuperacao:
+            if self.sack_permitido:
+                # Os trechos confirmados por SACK já saíram dos bytes em voo,
+                # então não é preciso inflar a janela
+                self._retransmitir_buracos()
+            else:
+                self.controle.ao_ack_duplicado()
+                self._enviar_fila()
+        elif self.acks_duplicados == 3 and (self.recuperar_ate is None or
+                                            self.last_acked_no >= self.recuperar_ate):
+            # Só entra em recuperação se a perda não for de antes do último
+            # timeout ou da última recuperação (RFC 6582, seção 3.2)
+            self.controle.ao_detectar_perda(self._calcular_bytes_inflight(), self._agora())
+            self.em_recuperacao = True
+            self.recuperar_ate = self.current_seq_no
+
+            self.retransmissoes_rapidas += 1
+            self._retransmitir_primeiro()
+            if self.sack_permitido:
+                self._retransmitir_buracos()
+            else:
+                # Infla a janela pelos três segmentos que saíram da rede
+                for _ in range(3):
+                    self.controle.ao_ack_duplicado()
+            self.timer.armar(self._timeout_interval())
 
-        # Tenta enviar o que já está na fila
+    def _retransmitir_buracos(self):
+        """
+        Recuperação com SACK (RFC 6675): reenvia, enquanto couberem na janela,
+        os segmentos abaixo do maior trecho confirmado por SACK que não foram
+        recebidos, e depois dados novos
+        """
+        fila = self.fila_retransmissao
+        fila.marcar_perdidos()
+        while True:
+            i = fila.proximo_buraco()
+            if i is None or fila.bytes_em_voo + fila.tamanho(i) > self.controle.cwnd:
+                break
+            self.retransmissoes_rapidas += 1
+            self._retransmitir(i)
         self._enviar_fila()
 
+    def _calcular_bytes_inflight(self):
+        return self.fila_retransmissao.bytes_em_voo
+
+    def _enviar_ack(self):
+        """
+        Envia um ACK sem dados. Ele não ocupa número de sequência, então não
+        entra na fila de segmentos não reconhecidos.
+        """
+        if self.estado == FECHADA:
+            return
+        segment = montar_cabecalho(
+            self.id_conexao[3],
+            self.id_conexao[1],
+            self.current_seq_no,
+            self.expected_seq_no,
+            FLAGS_ACK,
+            self._opcoes(FLAGS_ACK),
+            self._janela_cabecalho(FLAGS_ACK),
+        )
+        segment = fix_checksum(
+            segment,
+            self.id_conexao[2],
+            self.id_conexao[0]
+        )
+        self._ack_enviado()
+        self.servidor.rede.enviar(segment, self.id_conexao[0])
+
+    def _transmitir(self, seq_no, flags, payload, opcoes=None):
+        """
+        Envia um segmento que ocupa números de sequência, registrando-o na
+        fila de retransmissão
+        """
+        if self.estado == FECHADA:
+            return
+        tamanho = len(payload)
+        if (flags & (FLAGS_SYN | FLAGS_FIN)) != 0:
+            tamanho += 1
+        retransmitido = seq_no < self.maior_seq_enviado
+        self.maior_seq_enviado = max(self.maior_seq_enviado, seq_no + tamanho)
+        self.fila_retransmissao.adicionar(seq_no, tamanho, flags, self._agora(),
+                                          retransmitido)
+        self._enviar_dados(seq_no, flags, payload, opcoes)
+
+        if not self.timer.armado:
+            self.timer.armar(self._timeout_interval())
+
+    def _opcoes(self, flags):
+        """
+        Opções do cabeçalho: blocos SACK enquanto houver dados guardados
+        fora de ordem
+        """
+        if self.sack_permitido and len(self.fila_reordenacao) > 0:
+            return opcao_sack(self.fila_reordenacao.blocos(MAX_BLOCOS_SACK))
+        return b''
+
+    def _enviar_dados(self, seq_no, flags, payload, opcoes=None):
+        if self.estado == FECHADA:
+            # Depois de _encerrar, nada mais sai nem rearma os timers
+            return
+        if opcoes is None:
+            opcoes = self._opcoes(flags)
+        segment = montar_cabecalho(
+            self.id_conexao[3],
+            self.id_conexao[1],
+            seq_no,
+            self.expected_seq_no,
+            flags,
+            opcoes,
+            self._janela_cabecalho(flags),
+        )
+        segment = segment + payload
+        segment = fix_checksum(
+            segment,
+            self.id_conexao[2],
+            self.id_conexao[0]
+        )
+        self._ack_enviado()
+        self.servidor.rede.enviar(segment, self.id_conexao[0])
+
+    def _retransmitir_primeiro(self):
+        """
+        Reenvia o primeiro segmento ainda não reconhecido
+        """
+        self._retransmitir(self.fila_retransmissao.indice_primeiro())
+
+    def _retransmitir(self, indice):
+        """
+        Reenvia um segmento da fila de retransmissão, remontando-o a partir
+        do buffer de envio
+        """
+        seq_no, tamanho, flags = self.fila_retransmissao.segmento(indice)
+        self.fila_retransmissao.marcar_retransmitido(indice)
+        if (flags & (FLAGS_SYN | FLAGS_FIN)) != 0:
+            self._enviar_dados(seq_no, flags, b'')
+            return
+        # Parte do segmento pode já ter sido reconhecida e liberada
+        inicio = max(seq_no, self.buffer_envio.inicio)
+        fim = seq_no + tamanho
+        # Se agora há blocos SACK a enviar, o segmento original pode não
+        # caber mais em um só
+        opcoes = self._opcoes(flags)
+        mss = MSS - len(opcoes)
+        while inicio < fim:
+            pedaco = min(mss, fim - inicio)
+            self._enviar_dados(inicio, flags, self.buffer_envio.ler(inicio, pedaco), opcoes)
+            inicio += pedaco
+
     def _enviar_fila(self):
-        while len(self.fila_de_envio) > 0 and self._calcular_bytes_inflight() + len(self.fila_de_envio[0][2]) <= self.current_window_size * MSS:
-            seq_no, flags, payload = self.fila_de_envio.pop(0)
-
-            segment = make_header(
-                self.id_conexao[3],
-                self.id_conexao[1],
-                seq_no,
-                self.expected_seq_no,
-                flags,
-            )
-            segment = segment + payload
-            segment = fix_checksum(
-                segment,
-                self.id_conexao[2],
-                self.id_conexao[0]
-            )
-
-            self.unacked_segments.append((seq_no, segment, time(), False))
-            self.servidor.rede.enviar(segment, self.id_conexao[0])
-
-            if self.timer is None:
-                self.timer = asyncio.get_event_loop().call_later(self._timeout_interval(), self._resend_timer)
+        """
+        Recorta do buffer de envio, em segmentos de até 1 MSS contando as
+        opções, os dados que ainda não foram enviados e que cabem na janela
+        atual
+        """
+        if self.estado == FECHADA:
+            return
+        # Com blocos SACK, sobra menos espaço para dados em cada segmento
+        opcoes = self._opcoes(FLAGS_ACK)
+        mss = MSS - len(opcoes)
+        buffer = self.buffer_envio
+        janela = self.controle.cwnd
+        # O receptor aceita até aqui
+        limite = self.last_acked_no + self.janela_receptor
+        while self.current_seq_no < buffer.fim:
+            tamanho = min(mss, buffer.fim - self.current_seq_no)
+            if self.current_seq_no + tamanho > limite:
+                # Só envia um pedaço da janela do receptor se ele for grande
+                # (RFC 1122, seção 4.2.3.4)
+                tamanho = limite - self.current_seq_no
+                if tamanho <= 0 or tamanho < self.maior_janela_receptor // 2:
+                    if len(self.fila_retransmissao) == 0:
+                        # Nenhum ACK virá para abrir a janela
+                        self._armar_persistencia()
+                    return
+            if tamanho < mss and not self._pode_enviar_pequeno(tamanho):
+                return
+            if self._calcular_bytes_inflight() + tamanho > janela:
+                return
+            payload = buffer.ler(self.current_seq_no, tamanho)
+            self._transmitir(self.current_seq_no, FLAGS_ACK, payload, opcoes)
+            self.current_seq_no += tamanho
+
+        if self.prestes_a_fechar and not self.fin_enviado:
+            # Todos os dados já foram enviados, então é a vez do FIN
+            self.fin_enviado = True
+            self._transmitir(self.current_seq_no, FLAGS_FIN, b'')
+            self.current_seq_no += 1
+
+    def _pode_enviar_pequeno(self, tamanho):
+        """
+        Decide se um segmento menor que o MSS pode sair agora ou se deve
+        esperar mais dados da aplicação
+        """
+        fim = self.current_seq_no + tamanho
+        if fim <= self.empurrar_ate or fim <= self.maior_seq_enviado:
+            # Pedido explícito de envio, ou reenvio depois de um timeout
+            return True
+        if self.tampado:
+            return False
+        # Nagle: só um segmento pequeno sem reconhecimento por vez
+        return not self.nagle or len(self.fila_retransmissao) == 0
+
+    def _armar_persistencia(self):
+        if not self.timer_persistencia.armado:
+            intervalo = max(INTERVALO_MINIMO_SONDAGEM, self._timeout_interval())
+            intervalo = min(intervalo * self.backoff_persistencia,
+                            INTERVALO_MAXIMO_SONDAGEM)
+            self.timer_persistencia.armar(intervalo)
+
+    def _sondar_janela(self):
+        """
+        Com a janela do receptor fechada, envia um byte além dela para que
+        o ACK traga a janela atual, caso a atualização tenha se perdido
+        """
+        if self.current_seq_no >= self.buffer_envio.fim or \
+                len(self.fila_retransmissao) > 0:
+            return
+        self._enviar_dados(self.current_seq_no, FLAGS_ACK,
+                           self.buffer_envio.ler(self.current_seq_no, 1))
+        self.backoff_persistencia = min(2 * self.backoff_persistencia, BACKOFF_MAXIMO)
+        self._armar_persistencia()
 
     def _resend_timer(self):
-        if len(self.unacked_segments) > 0:
-            # Houve uma perda! Devemos diminuir a janela pela metade
-            self.current_window_size = max(1, self.current_window_size // 2)
+        if len(self.fila_retransmissao) == 0:
+            return
+
+        # Houve uma perda! O controle de congestionamento reduz a janela
+        self.controle.ao_estourar_timeout(self._calcular_bytes_inflight(), self._agora())
+        self.em_recuperacao = False
+        self.acks_duplicados = 0
+        self.recuperar_ate = self.maior_seq_enviado
+        self.backoff = min(2 * self.backoff, BACKOFF_MAXIMO)
+        self.retransmissoes_por_timeout += 1
+
+        # Volta a enviar tudo a partir do primeiro byte não reconhecido,
+        # no ritmo da janela reduzida (RFC 5681, seção 3.1)
+        self.fila_retransmissao.limpar()
+        self.current_seq_no = self.last_acked_no
+        self.fin_enviado = False
+        self._enviar_fila()
 
-            self.servidor.rede.enviar(self.unacked_segments[0][1], self.id_conexao[0])
-            self.unacked_segments[0] = (*self.unacked_segments[0][:3], True)
-        
-        self.timer = asyncio.get_event_loop().call_later(self._timeout_interval(), self._resend_timer)
+        if not self.timer.armado:
+            self.timer.armar(self._timeout_interval())
 
 
     # Os métodos abaixo fazem parte da API
 
+    def definir_controle_congestionamento(self, controle):
+        """
+        Troca o algoritmo de controle de congestionamento desta conexão,
+        mantendo a janela e o limiar atuais
+        """
+        controle.cwnd = self.controle.cwnd
+        controle.ssthresh = self.controle.ssthresh
+        self.controle = controle
+
+    def definir_ack_imediato(self, imediato=True):
+        """
+        Desliga (ou religa) o atraso dos ACKs, para quando o outro lado
+        precisa de respostas rápidas
+        """
+        self.ack_imediato = imediato
+        if imediato and self.ack_enviado != self.expected_seq_no:
+            self._enviar_ack()
+
+    def pausar_leitura(self):
+        """
+        Para de entregar dados à aplicação. Eles passam a ocupar o buffer de
+        recepção, e a janela anunciada diminui até fechar.
+        """
+        self.leitura_pausada = True
+
+    def retomar_leitura(self):
+        """
+        Entrega os dados guardados enquanto a leitura esteve pausada e anuncia
+        a janela reaberta
+        """
+        self.leitura_pausada = False
+        if self._nao_lidos:
+            dados = b''.join(self._nao_lidos)
+            self._nao_lidos = []
+            self.bytes_nao_lidos = 0
+            self.callback(self, dados)
+        if self._janela_a_anunciar() > self._janela_restante():
+            self._enviar_ack()
+        if self._fin_nao_lido:
+            self._fin_nao_lido = False
+            self.callback(self, b'')
+
     def registrar_recebedor(self, callback):
         """
         Usado pela camada de aplicação para registrar uma função para ser chamada
@@ -239,21 +1228,428 @@ class Conexao:
         """
         self.callback = callback
 
+    def registrar_monitor_de_envio(self, callback):
+        """
+        Registra uma função para ser chamada, com a conexão, sempre que um
+        ACK liberar espaço no buffer de envio
+        """
+        self.callback_envio = callback
+
+    def registrar_monitor_de_encerramento(self, callback):
+        """
+        Registra uma função para ser chamada, com a conexão, quando ela
+        terminar: pelo fechamento dos dois lados, por um RST ou ao ser abortada
+        """
+        self.callback_encerramento = callback
+
+    def bytes_no_buffer_de_envio(self):
+        """
+        Bytes escritos pela aplicação que o outro lado ainda não reconheceu
+        """
+        return len(self.buffer_envio)
+
     def enviar(self, dados):
         """
-        Usado pela camada de aplicação para enviar dados
+        Usado pela camada de aplicação para enviar dados. Eles ficam no
+        buffer de envio até serem reconhecidos, sem limite de tamanho.
+        Depois de fechar() ou do fim da conexão, os dados são ignorados.
         """
-        self._enviar_segmento(
-            FLAGS_ACK,
-            dados
-        )
+        if self.estado not in ESTADOS_ESCRITA:
+            return
+        self.buffer_envio.acrescentar(dados)
+        self._enviar_fila()
+
+    def enviar_varios(self, buffers):
+        """
+        Envia vários buffers de uma vez, recortados juntos em segmentos
+        """
+        if self.estado not in ESTADOS_ESCRITA:
+            return
+        for dados in buffers:
+            self.buffer_envio.acrescentar(dados)
+        self._enviar_fila()
+
+    def definir_nagle(self, ativo=True):
+        """
+        Liga ou desliga o agrupamento de escritas pequenas enquanto há dados
+        sem reconhecimento (equivalente a TCP_NODELAY quando desligado)
+        """
+        self.nagle = ativo
+        self._enviar_fila()
+
+    def cork(self):
+        """
+        Segura os dados escritos até flush(), enviando apenas segmentos
+        cheios, para juntar uma rajada de respostas
+        """
+        self.tampado = True
+
+    def flush(self):
+        """
+        Desfaz cork() e envia imediatamente tudo que foi escrito até agora
+        """
+        self.tampado = False
+        self.empurrar_ate = self.buffer_envio.fim
+        self._enviar_fila()
 
     def fechar(self):
         """
-        Usado pela camada de aplicação para fechar a conexão
+        Usado pela camada de aplicação para fechar a conexão. O FIN sai
+        depois de todos os dados já escritos.
         """
+        if self.estado == ESTABELECIDA:
+            self.estado = FIN_WAIT_1
+        elif self.estado == CLOSE_WAIT:
+            self.estado = LAST_ACK
+        else:
+            return
+        self._armar_encerramento()
         self.prestes_a_fechar = True
-        self._enviar_segmento(
-            FLAGS_FIN,
-            b'',
-        )
+        self.tampado = False
+        self.empurrar_ate = self.buffer_envio.fim
+        self._enviar_fila()
+
+    def abortar(self):
+        """
+        Descarta a conexão imediatamente, enviando um RST ao outro lado
+        """
+        if self.estado != FECHADA:
+            self._enviar_dados(self.current_seq_no, FLAGS_RST | FLAGS_ACK, b'')
+            self._encerrar()
+
+
+class FilaRetransmissao:
+    """
+    Segmentos enviados e ainda não reconhecidos, em ordem de número de
+    sequência. Cada campo fica em um array próprio (em vez de uma tupla por
+    segmento) e os segmentos reconhecidos são descartados pela esquerda
+    avançando um índice, localizado com bisect.
+
+    A fila também é o placar de SACK (RFC 6675): marca os segmentos que o
+    outro lado confirmou com blocos SACK e os considerados perdidos, que são
+    os ainda não confirmados abaixo do maior trecho confirmado. O contador
+    bytes_em_voo não inclui os segmentos confirmados por SACK nem os perdidos
+    que ainda não foram retransmitidos.
+    """
+    __slots__ = ('_seqs', '_tamanhos', '_enviados_em', '_flags', '_retransmitidos',
+                 '_sackeados', '_perdidos', '_inicio', '_varridos', '_proximo_buraco',
+                 'maior_sack', 'bytes_em_voo')
+
+    def __init__(self):
+        self._seqs = array('q')         # número de sequência inicial
+        self._tamanhos = array('I')     # números de sequência ocupados
+        self._enviados_em = array('d')  # momento do último envio
+        self._flags = bytearray()       # flags TCP do segmento
+        self._retransmitidos = bytearray()
+        self._sackeados = bytearray()
+        self._perdidos = bytearray()
+        self._inicio = 0                # índice do primeiro não reconhecido
+        self._varridos = 0              # índice até onde as perdas já foram marcadas
+        self._proximo_buraco = 0        # índice a partir do qual procurar buracos
+        self.maior_sack = 0             # maior fim de bloco SACK recebido
+        self.bytes_em_voo = 0
+
+    def __len__(self):
+        return len(self._seqs) - self._inicio
+
+    def adicionar(self, seq_no, tamanho, flags, enviado_em, retransmitido=False):
+        self._seqs.append(seq_no)
+        self._tamanhos.append(tamanho)
+        self._enviados_em.append(enviado_em)
+        self._flags.append(flags)
+        self._retransmitidos.append(1 if retransmitido else 0)
+        self._sackeados.append(0)
+        self._perdidos.append(0)
+        self.bytes_em_voo += tamanho
+
+    def limpar(self):
+        """
+        Esquece todos os segmentos, que serão enviados novamente
+        """
+        del self._seqs[:]
+        del self._tamanhos[:]
+        del self._enviados_em[:]
+        del self._flags[:]
+        del self._retransmitidos[:]
+        del self._sackeados[:]
+        del self._perdidos[:]
+        self._inicio = 0
+        self._varridos = 0
+        self._proximo_buraco = 0
+        self.maior_sack = 0
+        self.bytes_em_voo = 0
+
+    def indice_primeiro(self):
+        return self._inicio
+
+    def segmento(self, i):
+        """
+        Retorna (seq_no, tamanho, flags) do segmento de índice i
+        """
+        return self._seqs[i], self._tamanhos[i], self._flags[i]
+
+    def tamanho(self, i):
+        return self._tamanhos[i]
+
+    def _em_voo(self, i):
+        return not self._sackeados[i] and \
+            (not self._perdidos[i] or self._retransmitidos[i])
+
+    def marcar_retransmitido(self, i=None):
+        if i is None:
+            i = self._inicio
+        if not self._em_voo(i):
+            # Um segmento perdido volta a estar em voo
+            self.bytes_em_voo += self._tamanhos[i]
+        self._retransmitidos[i] = 1
+
+    def marcar_sack(self, inicio, fim):
+        """
+        Marca como recebidos pelo outro lado os segmentos inteiramente
+        contidos no bloco SACK [inicio, fim)
+        """
+        i = bisect_left(self._seqs, inicio, self._inicio)
+        while i < len(self._seqs) and self._seqs[i] + self._tamanhos[i] <= fim:
+            if not self._sackeados[i]:
+                if self._em_voo(i):
+                    self.bytes_em_voo -= self._tamanhos[i]
+                self._sackeados[i] = 1
+            i += 1
+        if fim > self.maior_sack:
+            self.maior_sack = fim
+
+    def marcar_perdidos(self):
+        """
+        Marca como perdidos os segmentos não confirmados que terminam antes
+        do maior trecho confirmado por SACK. Cada segmento é visitado uma só
+        vez.
+        """
+        i = max(self._varridos, self._inicio)
+        while i < len(self._seqs) and \
+                self._seqs[i] + self._tamanhos[i] <= self.maior_sack:
+            if not self._sackeados[i] and not self._perdidos[i]:
+                if not self._retransmitidos[i]:
+                    self.bytes_em_voo -= self._tamanhos[i]
+                self._perdidos[i] = 1
+            i += 1
+        self._varridos = i
+
+    def proximo_buraco(self):
+        """
+        Retorna o índice do primeiro segmento perdido ainda não retransmitido,
+        ou None se não houver
+        """
+        i = max(self._proximo_buraco, self._inicio)
+        while i < self._varridos and (not self._perdidos[i] or
+                                      self._retransmitidos[i] or self._sackeados[i]):
+            i += 1
+        self._proximo_buraco = i
+        if i < self._varridos:
+            return i
+        return None
+
+    def reconhecer(self, ack_no):
+        """
+        Descarta os segmentos inteiramente cobertos por ack_no. Retorna
+        (enviado_em, retransmitido) do último deles, para a estimativa do RTT,
+        ou None se nenhum segmento foi reconhecido por completo.
+        """
+        # Último segmento que começa antes de ack_no
+        fim = bisect_left(self._seqs, ack_no, self._inicio) - 1
+        if fim >= self._inicio and self._seqs[fim] + self._tamanhos[fim] > ack_no:
+            # Reconhecido só em parte, continua na fila
+            fim -= 1
+        if fim < self._inicio:
+            return None
+
+        for i in range(self._inicio, fim + 1):
+            if self._em_voo(i):
+                self.bytes_em_voo -= self._tamanhos[i]
+        amostra = self._enviados_em[fim], self._retransmitidos[fim] == 1
+        self._inicio = fim + 1
+        self._compactar()
+        return amostra
+
+    def _compactar(self):
+        # Remove de fato os segmentos reconhecidos quando eles forem maioria,
+        # o que mantém o custo amortizado constante
+        if self._inicio > 64 and self._inicio * 2 > len(self._seqs):
+            i = self._inicio
+            del self._seqs[:i]
+            del self._tamanhos[:i]
+            del self._enviados_em[:i]
+            del self._flags[:i]
+            del self._retransmitidos[:i]
+            del self._sackeados[:i]
+            del self._perdidos[:i]
+            self._inicio = 0
+            self._varridos = max(0, self._varridos - i)
+            self._proximo_buraco = max(0, self._proximo_buraco - i)
+
+
+class FilaReordenacao:
+    """
+    Trechos recebidos fora de ordem, guardados como intervalos disjuntos de
+    números de sequência, até um limite de memória. A quantidade de bytes
+    guardados fica disponível em bytes_armazenados.
+    """
+    __slots__ = ('limite', '_inicios', '_trechos', '_ultimo_recebido', 'bytes_armazenados')
+
+    def __init__(self, limite):
+        self.limite = limite
+        self._inicios = []      # números de sequência iniciais, ordenados
+        self._trechos = {}      # número de sequência inicial -> dados
+        self._ultimo_recebido = None
+        self.bytes_armazenados = 0
+
+    def __len__(self):
+        return len(self._inicios)
+
+    def inserir(self, seq_no, dados):
+        """
+        Guarda dados a partir de seq_no, descartando o que já estiver
+        guardado. Retorna False se não couber no limite de memória.
+        """
+        fim = seq_no + len(dados)
+        self._ultimo_recebido = seq_no
+        i = bisect_right(self._inicios, seq_no)
+        if i > 0:
+            anterior = self._inicios[i-1]
+            fim_anterior = anterior + len(self._trechos[anterior])
+            if fim_anterior >= fim:
+                return True
+            if fim_anterior > seq_no:
+                dados = dados[fim_anterior - seq_no:]
+                seq_no = fim_anterior
+
+        while i < len(self._inicios) and self._inicios[i] < fim:
+            seguinte = self._inicios[i]
+            fim_seguinte = seguinte + len(self._trechos[seguinte])
+            if fim_seguinte > fim:
+                dados = dados[:seguinte - seq_no]
+                break
+            # Inteiramente coberto pelos dados novos
+            del self._inicios[i]
+            self.bytes_armazenados -= len(self._trechos.pop(seguinte))
+
+        if len(dados) == 0:
+            return True
+        if self.bytes_armazenados + len(dados) > self.limite:
+            return False
+        self._inicios.insert(i, seq_no)
+        self._trechos[seq_no] = dados
+        self.bytes_armazenados += len(dados)
+        return True
+
+    def retirar(self, seq_no):
+        """
+        Retira e retorna os dados contíguos a partir de seq_no, descartando
+        os trechos que ficaram para trás
+        """
+        partes = []
+        n = 0
+        while n < len(self._inicios) and self._inicios[n] <= seq_no:
+            inicio = self._inicios[n]
+            dados = self._trechos.pop(inicio)
+            self.bytes_armazenados -= len(dados)
+            if inicio + len(dados) > seq_no:
+                partes.append(dados[seq_no - inicio:])
+                seq_no = inicio + len(dados)
+            n += 1
+        del self._inicios[:n]
+        return b''.join(partes)
+
+    def blocos(self, maximo):
+        """
+        Retorna até maximo blocos SACK (inicio, fim), juntando os trechos
+        contíguos. O primeiro bloco é o que contém o segmento recebido mais
+        recentemente (RFC 2018, seção 4).
+        """
+        blocos = []
+        for inicio in self._inicios:
+            fim = inicio + len(self._trechos[inicio])
+            if blocos and blocos[-1][1] == inicio:
+                blocos[-1][1] = fim
+            else:
+                blocos.append([inicio, fim])
+        for i, (inicio, fim) in enumerate(blocos):
+            if inicio <= self._ultimo_recebido < fim:
+                blocos.insert(0, blocos.pop(i))
+                break
+        return [tuple(bloco) for bloco in blocos[:maximo]]
+
+
+# Capacidade inicial do buffer de envio de cada conexão (potência de 2)
+CAPACIDADE_BUFFER_ENVIO = 4096
+
+class BufferEnvio:
+    """
+    Buffer de envio de uma conexão, guardado em um anel de bytes e indexado
+    por número de sequência. Guarda os dados da aplicação desde o primeiro
+    byte ainda não reconhecido (inicio) até o último escrito (fim). Os
+    segmentos são recortados sob demanda com ler, e liberar descarta os bytes
+    reconhecidos em O(1), apenas avançando o início do anel.
+
+    O anel só é alocado na primeira escrita, então uma conexão que nunca
+    envia nada não ocupa memória com ele.
+    """
+    __slots__ = ('_anel', '_capacidade_inicial', '_cabeca', 'inicio', 'fim')
+
+    def __init__(self, seq_inicial, capacidade=CAPACIDADE_BUFFER_ENVIO):
+        self._anel = bytearray()
+        self._capacidade_inicial = capacidade
+        self._cabeca = 0            # posição no anel do byte de número inicio
+        self.inicio = seq_inicial
+        self.fim = seq_inicial
+
+    def __len__(self):
+        return self.fim - self.inicio
+
+    def acrescentar(self, dados):
+        """
+        Copia dados para o final do buffer, aumentando o anel se preciso
+        """
+        dados = memoryview(dados).cast('B')
+        n = len(dados)
+        if len(self) + n > len(self._anel):
+            self._crescer(len(self) + n)
+        capacidade = len(self._anel)
+        pos = (self._cabeca + len(self)) % capacidade
+        primeiro = min(n, capacidade - pos)
+        self._anel[pos:pos+primeiro] = dados[:primeiro]
+        if primeiro < n:
+            # Dá a volta no anel
+            self._anel[:n-primeiro] = dados[primeiro:]
+        self.fim += n
+
+    def ler(self, seq_no, tamanho):
+        """
+        Retorna tamanho bytes a partir do número de sequência seq_no. Se eles
+        estiverem contíguos no anel, retorna um memoryview sem copiar nada.
+        """
+        capacidade = len(self._anel)
+        pos = (self._cabeca + seq_no - self.inicio) % capacidade
+        if pos + tamanho <= capacidade:
+            return memoryview(self._anel)[pos:pos+tamanho]
+        return self._anel[pos:] + self._anel[:pos + tamanho - capacidade]
+
+    def liberar(self, seq_no):
+        """
+        Descarta os bytes anteriores a seq_no, que já foram reconhecidos
+        """
+        n = min(seq_no, self.fim) - self.inicio
+        if n <= 0:
+            return
+        self._cabeca = (self._cabeca + n) % len(self._anel)
+        self.inicio += n
+
+    def _crescer(self, minimo):
+        capacidade = max(len(self._anel), self._capacidade_inicial)
+        while capacidade < minimo:
+            capacidade *= 2
+        tamanho = len(self)
+        anel = bytearray(capacidade)
+        if tamanho > 0:
+            anel[:tamanho] = self.ler(self.inicio, tamanho)
+        self._anel = anel
+        self._cabeca = 0
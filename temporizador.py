@@ -0,0 +1,160 @@
+import asyncio
+import traceback
+
+# Duração de um tique da roda (s)
+RESOLUCAO = 0.01
+# O primeiro nível tem 256 posições, uma por tique. Cada nível acima tem 64
+# posições, cada uma cobrindo o nível de baixo inteiro.
+BITS_NIVEL0 = 8
+BITS_NIVEL = 6
+NIVEIS = 4
+# Maior atraso representável, em tiques
+ATRASO_MAXIMO = (1 << (BITS_NIVEL0 + (NIVEIS-1) * BITS_NIVEL)) - 1
+
+
+class RodaTemporizadores:
+    """
+    Roda de temporizadores hierárquica (Varghese e Lauck), compartilhada por
+    todas as conexões de um Servidor. Armar, rearmar e desarmar um
+    temporizador custa O(1), sem criar objetos novos no laço de eventos: a
+    roda usa um único timer do asyncio, que avança um tique por vez enquanto
+    houver temporizadores armados.
+
+    Um temporizador nunca dispara antes do seu prazo, e dispara no máximo
+    um tique depois dele.
+    """
+    def __init__(self, resolucao=RESOLUCAO):
+        self.resolucao = resolucao
+        self.loop = asyncio.get_event_loop()
+        self._origem = self.loop.time()
+        self._tique = 0             # último tique já processado
+        self._niveis = [[{} for _ in range(1 << BITS_NIVEL0)]] + \
+            [[{} for _ in range(1 << BITS_NIVEL)] for _ in range(NIVEIS - 1)]
+        self._armados = 0
+        self._handle = None
+
+    def __len__(self):
+        return self._armados
+
+    def criar(self, callback):
+        """
+        Cria um temporizador desarmado que chama callback() ao expirar
+        """
+        return Temporizador(self, callback)
+
+    def _inserir(self, temporizador):
+        expira = temporizador.expira
+        atraso = expira - self._tique
+        if atraso < 1 << BITS_NIVEL0:
+            posicao = self._niveis[0][expira & ((1 << BITS_NIVEL0) - 1)]
+        else:
+            nivel = 1
+            limite = 1 << (BITS_NIVEL0 + BITS_NIVEL)
+            while atraso >= limite and nivel < NIVEIS - 1:
+                nivel += 1
+                limite <<= BITS_NIVEL
+            deslocamento = BITS_NIVEL0 + (nivel-1) * BITS_NIVEL
+            posicao = self._niveis[nivel][(expira >> deslocamento) & ((1 << BITS_NIVEL) - 1)]
+        posicao[temporizador] = None
+        temporizador._posicao = posicao
+
+    def _armar(self, temporizador, atraso):
+        if temporizador._posicao is not None:
+            del temporizador._posicao[temporizador]
+        else:
+            self._armados += 1
+        tiques = -int(-(self.loop.time() + atraso - self._origem) // self.resolucao)
+        temporizador.expira = min(max(tiques, self._tique + 1),
+                                  self._tique + ATRASO_MAXIMO)
+        self._inserir(temporizador)
+        if self._handle is None:
+            self._agendar()
+
+    def _desarmar(self, temporizador):
+        if temporizador._posicao is not None:
+            del temporizador._posicao[temporizador]
+            temporizador._posicao = None
+            self._armados -= 1
+
+    def _agendar(self):
+        self._handle = self.loop.call_at(
+            self._origem + (self._tique + 1) * self.resolucao, self._avancar)
+
+    def _avancar(self):
+        """
+        Processa os tiques até o momento atual, disparando os temporizadores
+        vencidos
+        """
+        self._handle = None
+        # Esta chamada foi agendada para o próximo tique, então ele é sempre
+        # processado, mesmo que o arredondamento diga o contrário
+        agora = max(int((self.loop.time() - self._origem) // self.resolucao),
+                    self._tique + 1)
+        while self._tique < agora:
+            if self._armados == 0:
+                # Nada para disparar no caminho: pula direto
+                self._tique = agora
+                break
+            self._tique += 1
+            self._cascatear()
+            indice = self._tique & ((1 << BITS_NIVEL0) - 1)
+            vencidos = self._niveis[0][indice]
+            if not vencidos:
+                continue
+            self._niveis[0][indice] = {}
+            # Retira um por vez, já que um callback pode desarmar ou rearmar
+            # outro temporizador que vence neste mesmo tique
+            while vencidos:
+                temporizador, _ = vencidos.popitem()
+                temporizador._posicao = None
+                self._armados -= 1
+                try:
+                    temporizador.callback()
+                except Exception:
+                    traceback.print_exc()
+        if self._armados > 0 and self._handle is None:
+            self._agendar()
+
+    def _cascatear(self):
+        """
+        Ao completar uma volta de um nível, redistribui nos níveis de baixo
+        os temporizadores da próxima posição do nível de cima
+        """
+        tique = self._tique
+        deslocamento = BITS_NIVEL0
+        for nivel in range(1, NIVEIS):
+            if tique & ((1 << deslocamento) - 1) != 0:
+                return
+            indice = (tique >> deslocamento) & ((1 << BITS_NIVEL) - 1)
+            posicao = self._niveis[nivel][indice]
+            if posicao:
+                self._niveis[nivel][indice] = {}
+                for temporizador in posicao:
+                    self._inserir(temporizador)
+            deslocamento += BITS_NIVEL
+
+
+class Temporizador:
+    """
+    Temporizador reutilizável de uma RodaTemporizadores
+    """
+    __slots__ = ('roda', 'callback', 'expira', '_posicao')
+
+    def __init__(self, roda, callback):
+        self.roda = roda
+        self.callback = callback
+        self.expira = None
+        self._posicao = None
+
+    @property
+    def armado(self):
+        return self._posicao is not None
+
+    def armar(self, atraso):
+        """
+        Arma (ou rearma) o temporizador para disparar daqui a atraso segundos
+        """
+        self.roda._armar(self, atraso)
+
+    def desarmar(self):
+        self.roda._desarmar(self)
@@ -0,0 +1,175 @@
+import asyncio
+
+# Limites padrão do buffer de escrita (bytes). Acima de LIMITE_ESCRITA o
+# protocolo é avisado para parar de escrever (StreamWriter.drain bloqueia),
+# e volta a poder escrever quando o buffer cai a LIMITE_ESCRITA // 4.
+LIMITE_ESCRITA = 64 * 1024
+# Limite do buffer do StreamReader (bytes), como em asyncio.start_server.
+# Acima de 2*LIMITE_LEITURA, a leitura da conexão é pausada.
+LIMITE_LEITURA = 64 * 1024
+
+
+class TransporteTCP(asyncio.Transport):
+    """
+    Transporte do asyncio sobre uma tcp.Conexao, para que protocolos e
+    streams do asyncio funcionem sobre a nossa pilha.
+
+    write nunca bloqueia, mas o protocolo recebe pause_writing quando os
+    bytes ainda não reconhecidos pelo outro lado passam do limite alto e
+    resume_writing quando caem ao limite baixo. pause_reading e
+    resume_reading param e retomam a entrega de dados, fechando e reabrindo
+    a janela anunciada ao outro lado.
+    """
+    def __init__(self, conexao, protocolo, loop=None):
+        ip_cliente, porta_cliente, ip_servidor, porta_servidor = conexao.id_conexao
+        super().__init__({
+            'peername': (ip_cliente, porta_cliente),
+            'sockname': (ip_servidor, porta_servidor),
+            'conexao': conexao,
+        })
+        self._loop = loop or asyncio.get_event_loop()
+        self._conexao = conexao
+        self._protocolo = protocolo
+        self._fechando = False
+        self._perdida = False
+        self._escrita_pausada = False
+        self._limite_alto = LIMITE_ESCRITA
+        self._limite_baixo = LIMITE_ESCRITA // 4
+        conexao.registrar_recebedor(self._dados_recebidos)
+        conexao.registrar_monitor_de_envio(self._envio_liberado)
+        conexao.registrar_monitor_de_encerramento(self._encerrada)
+        # Chamado na hora, e não com call_soon como nos transportes do
+        # asyncio, porque o ACK que completa o handshake pode trazer dados
+        protocolo.connection_made(self)
+
+    def _dados_recebidos(self, conexao, dados):
+        if self._perdida:
+            return
+        if dados == b'':
+            if not self._protocolo.eof_received():
+                self.close()
+        else:
+            self._protocolo.data_received(dados)
+
+    def _envio_liberado(self, conexao):
+        if self._escrita_pausada and \
+                conexao.bytes_no_buffer_de_envio() <= self._limite_baixo:
+            self._escrita_pausada = False
+            self._protocolo.resume_writing()
+
+    def _verificar_limite_escrita(self):
+        if not self._escrita_pausada and \
+                self._conexao.bytes_no_buffer_de_envio() > self._limite_alto:
+            self._escrita_pausada = True
+            self._protocolo.pause_writing()
+
+    def _encerrada(self, conexao):
+        if self._perdida:
+            return
+        self._perdida = True
+        self._fechando = True
+        self._loop.call_soon(self._protocolo.connection_lost, None)
+
+    # Leitura
+
+    def is_reading(self):
+        return not self._conexao.leitura_pausada
+
+    def pause_reading(self):
+        self._conexao.pausar_leitura()
+
+    def resume_reading(self):
+        if self._conexao.leitura_pausada:
+            # Os dados guardados são entregues fora da chamada, como um
+            # transporte do asyncio faria ao voltar a ler do socket
+            self._loop.call_soon(self._retomar_leitura)
+
+    def _retomar_leitura(self):
+        if not self._perdida:
+            self._conexao.retomar_leitura()
+
+    # Escrita
+
+    def write(self, data):
+        if self._fechando:
+            return
+        self._conexao.enviar(data)
+        self._verificar_limite_escrita()
+
+    def writelines(self, list_of_data):
+        if self._fechando:
+            return
+        self._conexao.enviar_varios(list_of_data)
+        self._verificar_limite_escrita()
+
+    def write_eof(self):
+        self._conexao.fechar()
+
+    def can_write_eof(self):
+        return True
+
+    def get_write_buffer_size(self):
+        return self._conexao.bytes_no_buffer_de_envio()
+
+    def get_write_buffer_limits(self):
+        return self._limite_baixo, self._limite_alto
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        if high is None:
+            high = LIMITE_ESCRITA if low is None else 4 * low
+        if low is None:
+            low = high // 4
+        if not high >= low >= 0:
+            raise ValueError('high (%r) deve ser >= low (%r) deve ser >= 0' % (high, low))
+        self._limite_alto = high
+        self._limite_baixo = low
+        self._verificar_limite_escrita()
+        self._envio_liberado(self._conexao)
+
+    # Fechamento
+
+    def is_closing(self):
+        return self._fechando
+
+    def close(self):
+        if self._fechando:
+            return
+        self._fechando = True
+        self._conexao.fechar()
+
+    def abort(self):
+        self._fechando = True
+        self._conexao.abortar()
+
+    def get_protocol(self):
+        return self._protocolo
+
+    def set_protocol(self, protocol):
+        self._protocolo = protocol
+
+
+def servir(servidor, cliente_conectado, limite=LIMITE_LEITURA):
+    """
+    Como asyncio.start_server, mas sobre um tcp.Servidor: chama
+    cliente_conectado(reader, writer) para cada conexão aceita, com um
+    asyncio.StreamReader e um asyncio.StreamWriter. cliente_conectado pode
+    ser uma função comum ou uma corrotina.
+    """
+    loop = asyncio.get_event_loop()
+
+    def conexao_aceita(conexao):
+        reader = asyncio.StreamReader(limit=limite, loop=loop)
+        protocolo = asyncio.StreamReaderProtocol(reader, cliente_conectado, loop=loop)
+        TransporteTCP(conexao, protocolo, loop)
+
+    servidor.registrar_monitor_de_conexoes_aceitas(conexao_aceita)
+
+
+def aceitar_com_protocolo(servidor, fabrica_protocolo):
+    """
+    Como loop.create_server, mas sobre um tcp.Servidor: cria um protocolo
+    com fabrica_protocolo() para cada conexão aceita
+    """
+    loop = asyncio.get_event_loop()
+    servidor.registrar_monitor_de_conexoes_aceitas(
+        lambda conexao: TransporteTCP(conexao, fabrica_protocolo(), loop))